@@ -6,6 +6,7 @@ from ultralytics import YOLO
 from typing import List, Dict
 from tqdm import tqdm
 from .config import settings
+from .pipeline.common import PERSON, BALL, sampled_frames, summarize_detections
 
 logger = logging.getLogger("ML_Analysis")
 
@@ -45,55 +46,33 @@ class AnalysisService:
         
         events = []
         
-        with open(log_path, "w") as f, tqdm(total=total_frames) as bar:
-            frame_idx = 0
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
+        # Written under a temporary name and renamed when complete, so the exists() check
+        # above never mistakes a run interrupted halfway for a finished one
+        partial_path = log_path + ".partial"
+        with open(partial_path, "w") as f, tqdm(total=total_frames) as bar:
+            for frame_idx, frame in sampled_frames(cap, skip_frames):
+                # Run Inference
+                # Classes: 0=person, 32=sports ball (COCO dataset)
+                results = self.model(frame, classes=[PERSON, BALL], verbose=False)
                 
-                if frame_idx % skip_frames == 0:
-                    # Run Inference
-                    # Classes: 0=person, 32=sports ball (COCO dataset)
-                    results = self.model(frame, classes=[0, 32], verbose=False)
-                    
-                    # Parse results
-                    players_count = 0
-                    ball_detected = False
-                    ball_coords = None
-                    
-                    for r in results:
-                        for box in r.boxes:
-                            cls = int(box.cls[0])
-                            if cls == 0: # person
-                                players_count += 1
-                            elif cls == 32: # sports ball
-                                ball_detected = True
-                                # Extract coordinates (center_x, center_y, w, h) normalized? No, usually pixels.
-                                # box.xywh returns tensor. Convert to list.
-                                xywh = box.xywh[0].tolist() 
-                                ball_coords = {"x": xywh[0], "y": xywh[1], "w": xywh[2], "h": xywh[3]}
+                # Parse results (counts, best ball box, player centroids) in one pass over the arrays
+                detections = summarize_detections(results[0].boxes.data.cpu().numpy())
 
-                    # Convert to EventCreate Schema
-                    event_data = {
-                        "timestamp": frame_idx / fps,
-                        "frame": frame_idx,
-                        "type": "stats", # Generic type for periodic stats
-                        "event_metadata": {
-                            "players": players_count,
-                            "ball_detected": ball_detected,
-                            "ball_coords": ball_coords
-                        }
-                    }
-                    
-                    # Convert to JSON line
-                    json_line = json.dumps(event_data)
-                    f.write(json_line + "\n")
-                    
-                frame_idx += 1
-                bar.update(1)
+                # Convert to EventCreate Schema
+                event_data = {
+                    "timestamp": frame_idx / fps,
+                    "frame": frame_idx,
+                    "type": "stats", # Generic type for periodic stats
+                    "event_metadata": detections
+                }
+                
+                # Convert to JSON line
+                json_line = json.dumps(event_data)
+                f.write(json_line + "\n")
+                bar.update(frame_idx + 1 - bar.n)
 
         cap.release()
+        os.replace(partial_path, log_path)
         logger.info(f"Analysis Complete. Log saved to {log_path}")
 
 def run_analysis():
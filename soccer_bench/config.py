@@ -22,6 +22,90 @@ class BenchConfig(BaseModel):
     # Destination for ML Events
     EVENTS_DIR: str = os.path.join(PROCESSED_STORAGE_DIR, "events")
     
+    # Ingest Concurrency
+    # Max simultaneous transfers across all rigs (bench NIC / disk budget)
+    INGEST_MAX_CONCURRENT: int = int(os.getenv("INGEST_MAX_CONCURRENT", "6"))
+    # Max simultaneous transfers from a single rig (Pi Wi-Fi budget)
+    INGEST_PER_NODE_CONCURRENT: int = int(os.getenv("INGEST_PER_NODE_CONCURRENT", "1"))
+    # Resumable transfers
+    INGEST_CHUNK_SIZE: int = 1024 * 1024
+    INGEST_JOURNAL_INTERVAL: int = 64 * 1024 * 1024 # fsync + journal every 64MB
+    INGEST_BACKOFF_BASE: int = 10 # seconds, doubled per consecutive failure
+    INGEST_BACKOFF_MAX: int = 600
+    # Pull files that are still being recorded, so only the tail is left at full time
+    INGEST_LIVE_OFFLOAD: bool = os.getenv("INGEST_LIVE_OFFLOAD", "True").lower() == "true"
+    
+    # Pipeline job store (SQLite, WAL)
+    JOB_DB_PATH: str = os.path.join(PROCESSED_STORAGE_DIR, "pipeline.db")
+    JOB_MAX_ATTEMPTS: int = 3
+    # A failed job waits JOB_RETRY_BASE seconds before its next attempt, doubling per attempt
+    JOB_RETRY_BASE: int = 30
+    JOB_RETRY_MAX: int = 600
+    # Stages are woken by events; this is only the safety-net rescan / retry interval
+    FALLBACK_SCAN_INTERVAL: int = 300
+    
+    # Stitching
+    # Sessions stitched in parallel; each ffmpeg gets cores / workers threads unless overridden
+    STITCH_WORKERS: int = int(os.getenv("STITCH_WORKERS", "2"))
+    STITCH_THREADS_PER_JOB: int = int(os.getenv("STITCH_THREADS_PER_JOB", "0"))
+    # >1 splits one session into keyframe-aligned time slices encoded in parallel, then concats
+    STITCH_SLICES: int = int(os.getenv("STITCH_SLICES", "1"))
+    # Output codec family for the encoder probe: h264 (plays everywhere), hevc, or any (fastest wins)
+    STITCH_CODEC: str = os.getenv("STITCH_CODEC", "h264")
+    # Probe result per host + ffmpeg build; delete to force a re-benchmark
+    ENCODER_CACHE_PATH: str = os.path.join(PROCESSED_STORAGE_DIR, "encoder_probe.json")
+    ENCODER_BENCH_SIZE: str = "1920x1080"
+    # Decode inputs on the probed hwaccel (cuda/qsv/vaapi) when there is one
+    STITCH_HWACCEL_DECODE: bool = os.getenv("STITCH_HWACCEL_DECODE", "True").lower() == "true"
+    # Panorama width; each input is downscaled to width/3 at decode. 0 = native (3x input width)
+    STITCH_OUTPUT_WIDTH: int = int(os.getenv("STITCH_OUTPUT_WIDTH", "0"))
+    # "hstack" (side by side) or "panorama" (calibrated warp + blend, falls back to hstack)
+    STITCH_MODE: str = os.getenv("STITCH_MODE", "hstack")
+    # Adaptive-bitrate HLS ladder next to the MP4; smaller rungs come from the same decode.
+    # The top rung is the main output itself, so heights at or above it are skipped.
+    STITCH_HLS: bool = os.getenv("STITCH_HLS", "False").lower() == "true"
+    HLS_LADDER: List[int] = [2160, 1080, 540]
+    HLS_SEGMENT_SECONDS: int = 4
+    HLS_DIR: str = os.path.join(PROCESSED_STORAGE_DIR, "hls")
+    
+    # Panorama
+    PANORAMA_WIDTH: int = int(os.getenv("PANORAMA_WIDTH", "3840"))
+    PANORAMA_FEATHER: int = 64 # px of blend ramp at each camera edge
+    PANORAMA_QUEUE_FRAMES: int = 8 # decoded frames buffered per camera
+    # Homographies per rig setup, plus the remap tables derived from them
+    CALIBRATION_PATH: str = os.path.join(PROCESSED_STORAGE_DIR, "calibration.json")
+    CALIBRATION_CACHE_DIR: str = os.path.join(PROCESSED_STORAGE_DIR, "calibration")
+    CALIBRATION_SNAPSHOT_TIME: float = 10.0 # seconds into the recording to grab calibration frames
+    CALIBRATION_MIN_INLIERS: int = 40
+    
+    # ML
+    # Sampled frames per forward pass; larger batches keep GPU / OpenVINO / ONNX backends busy
+    ML_BATCH_SIZE: int = int(os.getenv("ML_BATCH_SIZE", "8"))
+    # Decoded frames waiting for inference are capped by bytes, so 4K panoramas can't balloon memory
+    ML_PREFETCH_BYTES: int = 512 * 1024 * 1024
+    # FFmpeg threads inside the decode thread (0 = let FFmpeg decide)
+    ML_DECODE_THREADS: int = int(os.getenv("ML_DECODE_THREADS", "0"))
+    # "full" = whole frame resized to the model input; "tiled" = plus overlapping native-resolution tiles;
+    # "roi" = tiled scan on keyframes, and only a tile around the last known ball in between
+    ML_INFERENCE_MODE: str = os.getenv("ML_INFERENCE_MODE", "full")
+    ML_TILE_SIZE: int = 640
+    ML_TILE_OVERLAP: float = 0.2
+    ML_ROI_KEYFRAME_INTERVAL: int = 5 # sampled frames between full tiled scans in roi mode
+    ML_MERGE_OVERLAP: float = 0.6 # intersection over the smaller box above which cross-tile duplicates merge
+    # Inference runtime: "auto" (fastest benchmarked, else first available), "openvino", "onnx" or "torch"
+    ML_BACKEND: str = os.getenv("ML_BACKEND", "auto")
+    ML_IMGSZ: int = 640 # model input size exported models are built for
+    ML_INT8: bool = os.getenv("ML_INT8", "False").lower() == "true" # OpenVINO only, needs nncf
+    ML_INT8_DATA: str = os.getenv("ML_INT8_DATA", "coco8.yaml") # calibration dataset for INT8 export
+    MODEL_CACHE_DIR: str = os.path.join(PROCESSED_STORAGE_DIR, "models")
+    MODEL_BENCH_PATH: str = os.path.join(PROCESSED_STORAGE_DIR, "models", "benchmark.json")
+    # "stitched" analyzes the panorama after stitching; "cameras" analyzes the three raw inputs
+    # in parallel processes as soon as they're ingested (alongside stitching), then projects
+    # the detections into panorama coordinates
+    ML_SOURCE: str = os.getenv("ML_SOURCE", "stitched")
+    ML_CAMERA_WORKERS: int = int(os.getenv("ML_CAMERA_WORKERS", "3"))
+    ML_CHECKPOINT_INTERVAL: int = 30 # seconds between analysis checkpoints (resume point after a restart)
+    
     # Validation
     VERIFY_CHECKSUMS: bool = True
     
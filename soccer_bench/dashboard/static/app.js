@@ -17,15 +17,20 @@ async function updateStatus() {
         ingestStatus.className = ingest.status === 'idle' ? 'status-badge status-idle' : 'status-badge status-active';
 
         if (ingest.status.startsWith('downloading')) {
-            ingestList.innerHTML = `
+            let rows = "";
+            for (const [node, info] of Object.entries(ingest.nodes)) {
+                for (const [file, f] of Object.entries(info.files)) {
+                    rows += `
                 <div style="margin-bottom:10px">
-                    <strong>${ingest.node}</strong>: ${ingest.file}
+                    <strong>${node}</strong>: ${file}
                     <div class="progress-bar">
-                        <div class="progress-fill" style="width: ${ingest.progress}%"></div>
+                        <div class="progress-fill" style="width: ${f.progress}%"></div>
                     </div>
-                    <small>${ingest.progress}%</small>
-                </div>
-            `;
+                    <small>${f.status.replace('_', ' ')} - ${f.progress}%</small>
+                </div>`;
+                }
+            }
+            ingestList.innerHTML = rows;
         } else if (ingest.status === 'scanning') {
             ingestList.innerHTML = `<p style="color:#94a3b8">Scanning network for Rigs...</p>`;
         } else {
@@ -38,23 +43,28 @@ async function updateStatus() {
         const ml = pipe.ml;
 
         // Header
-        const activeCount = (stitcher.active_job ? 1 : 0) + (ml.status === 'analyzing' ? 1 : 0);
+        const activeCount = stitcher.active_jobs.length + (ml.status === 'analyzing' ? 1 : 0);
         document.getElementById('pipeline-count').textContent = activeCount > 0 ? `${activeCount} Active` : "Idle";
 
         const pipeList = document.getElementById('pipeline-list');
         let html = "";
 
-        // Stitcher Card
-        if (stitcher.active_job) {
+        // Stitcher Cards (one per running worker)
+        for (const job of stitcher.active_jobs) {
             html += `
                 <div style="padding:10px; background:#334155; border-radius:4px; margin-bottom:5px">
                     <div style="display:flex; justify-content:space-between">
                         <strong>Stitching</strong>
                         <span class="status-badge status-active">RUNNING</span>
                     </div>
-                    <small>Session: ${stitcher.active_job}</small>
+                    <small>Session: ${job}</small>
                 </div>`;
-        } else if (stitcher.queue_length > 0) {
+        }
+        if (stitcher.encoder && stitcher.encoder.encoder) {
+            const enc = stitcher.encoder;
+            html += `<div style="padding:5px; color:#94a3b8">Encoder: ${enc.encoder} (${enc.encoder_fps ?? '?'} fps) · Decode: ${enc.hwaccel || 'software'}</div>`;
+        }
+        if (stitcher.queue_length > 0) {
             html += `<div style="padding:5px; color:#94a3b8">Stitcher Queue: ${stitcher.queue_length}</div>`;
         }
 
@@ -72,6 +82,7 @@ async function updateStatus() {
                     </div>
                     <div style="display:flex; justify-content:space-between; margin-top:5px; font-size:0.8em; color:#a5b4fc">
                         <span>FPS: ${ml.fps}</span>
+                        <span>${ml.backend} · ${ml.mode} · batch ${ml.batch_size}: ${ml.batch_latency_ms}ms</span>
                         <span>Players: ${ml.stats.players}</span>
                         <span>Ball: ${ml.stats.ball ? 'YES' : 'NO'}</span>
                     </div>
@@ -0,0 +1,75 @@
+import os
+import logging
+import threading
+from collections import defaultdict
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError: # Optional: without it, stages fall back to a slow periodic rescan
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger("EventBus")
+
+class EventBus:
+    """
+    In-process pub/sub between bench services.
+    Callbacks run synchronously on the publisher's thread, so they must stay cheap
+    (index a file, enqueue a job) and hand real work to the stage workers.
+    """
+    def __init__(self):
+        self.subscribers = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def subscribe(self, topic, callback):
+        with self.lock:
+            self.subscribers[topic].append(callback)
+
+    def publish(self, topic, **payload):
+        with self.lock:
+            callbacks = list(self.subscribers[topic])
+        for callback in callbacks:
+            try:
+                callback(**payload)
+            except Exception as e:
+                logger.error(f"Subscriber for '{topic}' failed: {e}")
+
+event_bus = EventBus()
+
+class DropHandler(FileSystemEventHandler):
+    """Publishes 'file_dropped' once a file is fully written (close-after-write) or moved into place."""
+    def on_closed(self, event):
+        if not event.is_directory:
+            event_bus.publish("file_dropped", path=event.src_path)
+
+    def on_moved(self, event):
+        # A .part renamed into place is ingest finishing a download; ingest publishes
+        # 'file_ingested' itself once the checksum is verified
+        if not event.is_directory and not event.src_path.endswith(".part"):
+            event_bus.publish("file_dropped", path=event.dest_path)
+
+class FileWatcher:
+    """Fallback for files copied in by hand; services' own hand-offs go through the event bus."""
+    def __init__(self):
+        self.observer = None
+
+    def start(self, paths):
+        if Observer is None:
+            logger.info("watchdog not installed; relying on periodic rescans for hand-dropped files")
+            return False
+        self.observer = Observer()
+        for path in paths:
+            os.makedirs(path, exist_ok=True)
+            self.observer.schedule(DropHandler(), path, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+        logger.info(f"Watching {', '.join(paths)} for dropped files")
+        return True
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+
+file_watcher = FileWatcher()
@@ -1,10 +1,15 @@
 import os
+import json
 import requests
 import hashlib
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 from tqdm import tqdm
 from .config import settings
+from .events import event_bus
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -13,175 +18,432 @@ logger = logging.getLogger("IngestAgent")
 class IngestService:
     def __init__(self):
         self.status = "idle" # idle, scanning, downloading
-        self.current_node = None
-        self.current_file = None
-        self.progress = 0
-        self.total_bytes = 0
-        self.downloaded_bytes = 0
+        # Per-node / per-file transfer state:
+        # { "soccer-cam-l.local": { "status": "downloading", "files": { "x.mp4": {...} } } }
+        self.nodes = {}
+        self.lock = threading.Lock()
+        # Global cap across all rigs (bench NIC / disk), per-node cap (Pi Wi-Fi)
+        self.global_slots = threading.BoundedSemaphore(settings.INGEST_MAX_CONCURRENT)
+        # Per-node retry state: { node_name: { "failures": n, "next_attempt": ts } }
+        self.backoff = {}
+        # Running digests of .part files: { part_path: (hasher, offset) }
+        self.part_hashers = {}
+        # Delta listing state per node: last cursor, and manifests still needing work
+        self.cursors = {}
+        self.pending = {}
+        # Where each node serves file bytes (its sendfile transfer server if advertised)
+        self.download_bases = {}
         
     def get_status(self):
+        with self.lock:
+            nodes = {
+                name: {"status": node["status"], "files": {f: dict(s) for f, s in node["files"].items()}}
+                for name, node in self.nodes.items()
+            }
+        active = sum(
+            1 for node in nodes.values() for s in node["files"].values()
+            if s["status"].startswith("downloading")
+        )
         return {
-            "status": self.status,
-            "node": self.current_node,
-            "file": self.current_file,
-            "progress": self.progress
+            "status": "downloading" if active else self.status,
+            "active_transfers": active,
+            "nodes": nodes
         }
 
+    def node_name(self, base_url):
+        return base_url.replace("http://", "").replace(":8000", "")
+
+    def download_base(self, base_url):
+        return self.download_bases.get(base_url, f"{base_url}/api/v1/recordings")
+
+    def set_node_status(self, node_name, status):
+        with self.lock:
+            node = self.nodes.setdefault(node_name, {"status": "idle", "files": {}})
+            node["status"] = status
+
+    def set_file_status(self, node_name, file_name, status, **fields):
+        with self.lock:
+            node = self.nodes.setdefault(node_name, {"status": "idle", "files": {}})
+            entry = node["files"].setdefault(file_name, {
+                "status": status, "progress": 0, "downloaded_bytes": 0, "total_bytes": 0
+            })
+            entry["status"] = status
+            entry.update(fields)
+
+    def clear_file_status(self, node_name, file_name):
+        with self.lock:
+            node = self.nodes.get(node_name)
+            if node:
+                node["files"].pop(file_name, None)
+
     def ensure_dir(self, path):
         if not os.path.exists(path):
             os.makedirs(path)
 
-    def calculate_checksum(self, file_path, algo="sha256", chunk_size=4096):
-        """Calculates SHA256 checksum of a file."""
-        hasher = hashlib.sha256()
+    def calculate_checksum(self, file_path, algo="sha256", chunk_size=1024 * 1024, limit=None):
+        """Calculates the checksum of a file (optionally only its first `limit` bytes)."""
+        hasher = hashlib.new(algo)
+        self.hash_file_into(hasher, file_path, chunk_size, limit)
+        return hasher.hexdigest()
+
+    def hash_file_into(self, hasher, file_path, chunk_size=1024 * 1024, limit=None):
+        remaining = limit
         with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(chunk_size), b""):
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
                 hasher.update(chunk)
-        return hasher.hexdigest()
+                if remaining is not None:
+                    remaining -= len(chunk)
 
-    def download_file(self, url, dest_path):
-        """Downloads a file with progress tracking."""
+    def checksum_path(self, file_path, algo="sha256"):
+        return f"{file_path}.{algo}"
+
+    def save_checksum(self, file_path, value, algo="sha256"):
+        """Writes a sha256sum-compatible sidecar next to the file."""
+        with open(self.checksum_path(file_path, algo), "w") as f:
+            f.write(f"{value}  {os.path.basename(file_path)}\n")
+
+    def load_checksum(self, file_path, algo="sha256"):
+        """
+        Returns the stored digest for a file, hashing it only if no sidecar exists
+        (e.g. footage copied in by hand).
+        """
+        sidecar = self.checksum_path(file_path, algo)
+        if os.path.exists(sidecar):
+            with open(sidecar, "r") as f:
+                return f.read().split()[0]
+        value = self.calculate_checksum(file_path, algo)
+        self.save_checksum(file_path, value, algo)
+        return value
+
+    def read_journal(self, journal_path):
         try:
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                total_size = int(r.headers.get('content-length', 0))
-                self.total_bytes = total_size
-                self.downloaded_bytes = 0
-                
-                with open(dest_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        size = f.write(chunk)
-                        self.downloaded_bytes += size
-                        if total_size > 0:
-                            self.progress = int((self.downloaded_bytes / total_size) * 100)
-                            
-            return True
+            with open(journal_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_journal(self, journal_path, data):
+        tmp_path = journal_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, journal_path)
+
+    def download_file(self, url, dest_path, node_name=None, status="downloading", algo=None, live=False):
+        """
+        Downloads a file with progress tracking.
+        Data lands in '{dest}.part'; '{dest}.part.json' records the last offset that
+        was fsync'd to disk, so an interrupted transfer resumes with a Range request.
+        If `algo` is given, the digest is computed from the streamed chunks and
+        stored as a '{dest}.{algo}' sidecar, so verification needs no second read.
+        With `live=True` the source is still being recorded: whatever exists now is
+        appended to the .part file and the journal offset becomes the watermark
+        for the next pass; the file is only finalized by a later non-live call.
+        """
+        file_name = os.path.basename(dest_path)
+        part_path = dest_path + ".part"
+        journal_path = part_path + ".json"
+
+        journal = self.read_journal(journal_path)
+        offset = 0
+        # The journal is per destination file; the URL may differ between attempts
+        # (transfer server vs API fallback) while the bytes are the same.
+        if os.path.exists(part_path):
+            offset = min(journal.get("offset", 0), os.path.getsize(part_path))
+
+        try:
+            with self.global_slots:
+                self.set_file_status(node_name, file_name, status, progress=0)
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+                with requests.get(url, stream=True, headers=headers, timeout=(5, 30)) as r:
+                    if offset and r.status_code == 416:
+                        # Nothing past our offset: the .part already holds every byte the node has
+                        self.set_file_status(node_name, file_name, status, downloaded_bytes=offset)
+                        if live:
+                            return True
+                        return self.finalize_download(node_name, part_path, journal_path, dest_path,
+                                                      self.resume_hasher(part_path, algo, offset) if algo else None, algo)
+                    r.raise_for_status()
+                    if offset and r.status_code != 206:
+                        logger.warning(f"{node_name} ignored Range for {file_name}; restarting from 0")
+                        offset = 0
+                    if offset and not live:
+                        logger.info(f"Resuming {file_name} at byte {offset}")
+                    hasher = self.resume_hasher(part_path, algo, offset) if algo else None
+                    total_size = offset + int(r.headers.get('content-length', 0))
+                    downloaded = offset
+                    confirmed = offset
+                    self.set_file_status(node_name, file_name, status, total_bytes=total_size, downloaded_bytes=downloaded)
+                    
+                    with open(part_path, 'r+b' if offset else 'wb') as f:
+                        f.seek(offset)
+                        f.truncate()
+                        try:
+                            for chunk in r.iter_content(chunk_size=settings.INGEST_CHUNK_SIZE):
+                                size = f.write(chunk)
+                                if hasher:
+                                    hasher.update(chunk)
+                                downloaded += size
+                                if downloaded - confirmed >= settings.INGEST_JOURNAL_INTERVAL:
+                                    f.flush()
+                                    os.fsync(f.fileno())
+                                    confirmed = downloaded
+                                    self.write_journal(journal_path, {"url": url, "offset": confirmed, "total_bytes": total_size})
+                                progress = int((downloaded / total_size) * 100) if total_size > 0 else 0
+                                self.set_file_status(node_name, file_name, status, downloaded_bytes=downloaded, progress=progress)
+                        finally:
+                            # Everything written so far becomes the resume point / live watermark
+                            f.flush()
+                            os.fsync(f.fileno())
+                            self.write_journal(journal_path, {"url": url, "offset": downloaded, "total_bytes": total_size})
+                            if hasher:
+                                self.part_hashers[part_path] = (hasher.copy(), downloaded)
+
+                    if total_size and downloaded < total_size:
+                        raise IOError(f"Short read: {downloaded}/{total_size} bytes")
+
+            if live:
+                return True
+            return self.finalize_download(node_name, part_path, journal_path, dest_path, hasher, algo)
         except Exception as e:
             logger.error(f"Failed to download {url}: {e}")
-            if os.path.exists(dest_path):
-                os.remove(dest_path) # Cleanup partial
+            # Keep .part + journal for the next attempt
+            self.record_failure(node_name)
+            return False
+
+    def finalize_download(self, node_name, part_path, journal_path, dest_path, hasher, algo):
+        os.replace(part_path, dest_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        self.part_hashers.pop(part_path, None)
+        if hasher:
+            self.save_checksum(dest_path, hasher.hexdigest(), algo)
+        self.record_success(node_name)
+        return True
+
+    def resume_hasher(self, part_path, algo, offset):
+        """
+        Hasher primed with the first `offset` bytes of a .part file. Reuses the
+        in-memory state from the previous pass when it ends at the same offset,
+        otherwise (e.g. after a restart) re-reads the prefix once.
+        """
+        cached = self.part_hashers.get(part_path)
+        if cached and cached[1] == offset and cached[0].name == algo:
+            return cached[0].copy()
+        hasher = hashlib.new(algo)
+        if offset:
+            self.hash_file_into(hasher, part_path, limit=offset)
+        return hasher
+
+    def record_success(self, node_name):
+        with self.lock:
+            self.backoff.pop(node_name, None)
+
+    def record_failure(self, node_name):
+        with self.lock:
+            failures = self.backoff.get(node_name, {}).get("failures", 0) + 1
+            delay = min(settings.INGEST_BACKOFF_MAX, settings.INGEST_BACKOFF_BASE * (2 ** (failures - 1)))
+            self.backoff[node_name] = {"failures": failures, "next_attempt": time.time() + delay}
+        logger.warning(f"Node {node_name} failure #{failures}; backing off {delay}s")
+
+    def in_backoff(self, node_name):
+        with self.lock:
+            entry = self.backoff.get(node_name)
+        return bool(entry) and time.time() < entry["next_attempt"]
+
+    def process_session(self, base_url, man_file, target_dir):
+        """
+        Ingests a single session (manifest + video) from a node.
+        Returns True once the session needs no more work, False to retry on a later scan.
+        """
+        node_name = self.node_name(base_url)
+
+        # 1. Download Manifest
+        man_url = f"{self.download_base(base_url)}/{man_file}"
+        local_man_path = os.path.join(target_dir, man_file)
+        
+        if not os.path.exists(local_man_path):
+            logger.info(f"Downloading manifest: {man_file}")
+            ok = self.download_file(man_url, local_man_path, node_name, "downloading_manifest")
+            self.clear_file_status(node_name, man_file)
+            if not ok:
+                return False
+
+        # 2. Parse Manifest
+        try:
+            with open(local_man_path, 'r') as f:
+                data = json.load(f)
+                
+            video_file = data.get("file")
+            expected_checksum = data.get("checksum") or {}
+            algo = expected_checksum.get("algo", "sha256")
+            session_id = data.get("session_id")
+            camera_id = data.get("camera_id")
+            segment = data.get("segment")
+            
+            # Check if already offloaded
+            if data.get("offloaded", False):
+                 return True
+
+        except Exception as e:
+            logger.error(f"Failed to parse manifest {local_man_path}: {e}")
+            os.remove(local_man_path) # Re-fetch next time
             return False
 
+        try:
+            # 3. Download Video
+            video_url = f"{self.download_base(base_url)}/{video_file}"
+            local_video_path = os.path.join(target_dir, video_file)
+            
+            if not os.path.exists(local_video_path):
+                logger.info(f"Downloading video: {video_file} from {node_name}")
+                hash_algo = algo if settings.VERIFY_CHECKSUMS and expected_checksum else None
+                if not self.download_file(video_url, local_video_path, node_name, "downloading_video", hash_algo):
+                    return False
+
+            # 4. Verify Checksum
+            if settings.VERIFY_CHECKSUMS and expected_checksum:
+                self.set_file_status(node_name, video_file, "verifying")
+                logger.info(f"Verifying checksum for {video_file}...")
+                ref_val = expected_checksum.get("value")
+                
+                calc_val = self.load_checksum(local_video_path, algo)
+                if calc_val != ref_val:
+                    logger.error(f"CHECKSUM MISMATCH for {video_file}!")
+                    os.rename(local_video_path, local_video_path + ".bad")
+                    os.remove(self.checksum_path(local_video_path, algo))
+                    # Corrupt transfers (flaky link / storage) back off like any other node failure
+                    self.record_failure(node_name)
+                    return False
+
+            # Verified on disk: hand off to the stitcher now, confirm with the rig after
+            event_bus.publish("file_ingested", path=local_video_path, session_id=session_id, camera_id=camera_id)
+
+            # 5. Confirm Offload
+            self.set_file_status(node_name, video_file, "confirming")
+            logger.info(f"Confirming offload of {video_file} to {node_name}...")
+            confirm_payload = {
+                "session_id": session_id,
+                "camera_id": camera_id,
+                "file": video_file,
+                "checksum": expected_checksum
+            }
+            if segment is not None:
+                confirm_payload["segment"] = segment
+            try:
+                resp = requests.post(f"{base_url}/api/v1/recordings/confirm", json=confirm_payload, timeout=10)
+                resp.raise_for_status()
+            except Exception as e:
+                 logger.error(f"Error calling confirm endpoint: {e}")
+                 return False
+            return True
+        finally:
+            self.clear_file_status(node_name, video_file)
+
+    def process_live(self, base_url, entry, target_dir):
+        """Pulls the new tail of a file that is still being recorded, up to the current size."""
+        node_name = self.node_name(base_url)
+        video_file = entry["file"]
+        local_video_path = os.path.join(target_dir, video_file)
+        if os.path.exists(local_video_path):
+            return
+        algo = "sha256" if settings.VERIFY_CHECKSUMS else None
+        try:
+            self.download_file(f"{self.download_base(base_url)}/{video_file}", local_video_path,
+                               node_name, "downloading_live", algo, live=True)
+        finally:
+            # Shown only while a pass runs; a file that stops recording is picked up by its manifest
+            self.clear_file_status(node_name, video_file)
+
     def process_node(self, base_url, target_dir):
-        """Syncs recordings from a single node."""
-        node_name = base_url.replace("http://", "").replace(":8000", "")
-        self.current_node = node_name
+        """Syncs recordings from a single node, up to INGEST_PER_NODE_CONCURRENT files at once."""
+        node_name = self.node_name(base_url)
+        if self.in_backoff(node_name):
+            self.set_node_status(node_name, "backoff")
+            return
+        self.set_node_status(node_name, "scanning")
         logger.info(f"Checking node: {node_name} ({base_url})")
 
         try:
             # Get List
             try:
-                resp = requests.get(f"{base_url}/api/v1/recordings", timeout=3)
+                resp = requests.get(f"{base_url}/api/v1/recordings",
+                                    params={"since": self.cursors.get(node_name)}, timeout=3)
             except requests.exceptions.RequestException:
+                self.set_node_status(node_name, "offline")
                 return # Skip offline node silently-ish
 
             if resp.status_code != 200:
                 logger.warning(f"Node {node_name} unreachable or error: {resp.status_code}")
+                self.set_node_status(node_name, "error")
                 return
 
-            files = resp.json().get("files", [])
-            manifests = [f for f in files if f.endswith(".json")]
+            listing = resp.json()
+            pending = self.pending.setdefault(node_name, set())
+            for entry in listing.get("entries", []):
+                if entry.get("type") != "manifest":
+                    continue
+                if entry.get("offloaded"):
+                    pending.discard(entry["name"])
+                else:
+                    pending.add(entry["name"])
+            self.cursors[node_name] = listing.get("cursor")
+            transfer_port = listing.get("transfer_port")
+            if transfer_port:
+                self.download_bases[base_url] = f"http://{urlsplit(base_url).hostname}:{transfer_port}/recordings"
+            else:
+                self.download_bases.pop(base_url, None)
+            # Only new/changed manifests plus earlier failures; unchanged sessions aren't revisited
+            manifests = sorted(pending)
+            active = listing.get("active", []) if settings.INGEST_LIVE_OFFLOAD else []
             
-            if not manifests:
+            if not manifests and not active:
+                self.set_node_status(node_name, "idle")
                 return
 
             logger.info(f"Found {len(manifests)} sessions on {node_name}")
+            self.set_node_status(node_name, "downloading")
 
-            for man_file in manifests:
-                # 1. Download Manifest
-                man_url = f"{base_url}/static/{man_file}"
-                local_man_path = os.path.join(target_dir, man_file)
-                
-                if not os.path.exists(local_man_path):
-                    self.status = "downloading_manifest"
-                    self.current_file = man_file
-                    self.progress = 0
-                    
-                    logger.info(f"Downloading manifest: {man_file}")
-                    if not self.download_file(man_url, local_man_path):
-                        continue
-
-                # 2. Parse Manifest
-                import json
-                try:
-                    with open(local_man_path, 'r') as f:
-                        data = json.load(f)
-                        
-                    video_file = data.get("file")
-                    expected_checksum = data.get("checksum", {})
-                    session_id = data.get("session_id")
-                    camera_id = data.get("camera_id")
-                    
-                    # Check if already offloaded
-                    if data.get("offloaded", False):
-                         # logger.info(f"Skipping {man_file} (Already Marked Offloaded)")
-                         continue
-
-                except Exception as e:
-                    logger.error(f"Failed to parse manifest {local_man_path}: {e}")
-                    continue
+            with ThreadPoolExecutor(max_workers=settings.INGEST_PER_NODE_CONCURRENT) as pool:
+                futures = [
+                    pool.submit(self.process_session, base_url, man_file, target_dir)
+                    for man_file in manifests
+                ]
+                futures += [
+                    pool.submit(self.process_live, base_url, entry, target_dir)
+                    for entry in active
+                ]
+                for man_file, fut in zip(manifests, futures):
+                    if fut.exception():
+                        logger.error(f"Ingest job on {node_name} failed: {fut.exception()}")
+                    elif fut.result():
+                        pending.discard(man_file)
 
-                # 3. Download Video
-                video_url = f"{base_url}/static/{video_file}"
-                local_video_path = os.path.join(target_dir, video_file)
-                
-                if not os.path.exists(local_video_path):
-                    self.status = "downloading_video"
-                    self.current_file = video_file
-                    self.progress = 0
-                    
-                    logger.info(f"Downloading video: {video_file}")
-                    if not self.download_file(video_url, local_video_path):
-                        continue
-                else:
-                    pass # Already exists
-
-                # 4. Verify Checksum
-                if settings.VERIFY_CHECKSUMS and expected_checksum:
-                    self.status = "verifying"
-                    logger.info(f"Verifying checksum for {video_file}...")
-                    algo = expected_checksum.get("algo", "sha256")
-                    ref_val = expected_checksum.get("value")
-                    
-                    calc_val = self.calculate_checksum(local_video_path, algo)
-                    if calc_val != ref_val:
-                        logger.error(f"CHECKSUM MISMATCH for {video_file}!")
-                        os.rename(local_video_path, local_video_path + ".bad")
-                        continue
-
-                # 5. Confirm Offload
-                self.status = "confirming"
-                logger.info(f"Confirming offload to {node_name}...")
-                confirm_payload = {
-                    "session_id": session_id,
-                    "camera_id": camera_id,
-                    "file": video_file,
-                    "checksum": expected_checksum
-                }
-                try:
-                    requests.post(f"{base_url}/api/v1/recordings/confirm", json=confirm_payload)
-                except Exception as e:
-                     logger.error(f"Error calling confirm endpoint: {e}")
+            self.set_node_status(node_name, "idle")
 
         except Exception as e:
             logger.error(f"Error accessing node {node_name}: {e}")
-        finally:
-            self.current_node = None
-            self.current_file = None
-            self.status = "scanning"
+            self.set_node_status(node_name, "error")
 
     def running_loop(self):
         logger.info("Starting Ingest Loop...")
         self.ensure_dir(settings.RAW_STORAGE_DIR)
         
-        while True:
-            self.status = "scanning"
-            for node in settings.NODES:
-                self.progress = 0
-                self.process_node(node, settings.RAW_STORAGE_DIR)
-            
-            self.status = "idle"
-            time.sleep(10) # Wait 10s before next scan
+        # One worker per rig so every reachable node drains at the same time;
+        # total throughput is bounded by the slowest link, not the sum of all.
+        with ThreadPoolExecutor(max_workers=max(1, len(settings.NODES))) as pool:
+            while True:
+                self.status = "scanning"
+                futures = [
+                    pool.submit(self.process_node, node, settings.RAW_STORAGE_DIR)
+                    for node in settings.NODES
+                ]
+                for fut in futures:
+                    fut.result()
+                
+                self.status = "idle"
+                time.sleep(10) # Wait 10s before next scan
 
 ingest_service = IngestService()
-
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional, Dict, Any, List
+from .config import settings
+
+logger = logging.getLogger("JobStore")
+
+# Pipeline order; completing a stage enqueues the next one
+STAGES = ["stitch", "ml", "upload"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    session_id  TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending', -- pending, running, done, failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    error       TEXT,
+    artifacts   TEXT NOT NULL DEFAULT '{}',
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    not_before  REAL NOT NULL DEFAULT 0, -- retry backoff: not claimable before this time
+    PRIMARY KEY (session_id, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_stage_status ON jobs (stage, status, created_at);
+"""
+
+class JobStore:
+    """
+    Persistent, crash-safe pipeline state (SQLite in WAL mode).
+    One row per (session, stage) with attempts, timings and artifact paths.
+    Workers claim jobs atomically, so restarts neither redo nor skip work.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        # Wakes stage workers as soon as a job for their stage is queued
+        self.wakeup = threading.Condition()
+        self.generations = {stage: 0 for stage in STAGES}
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self.conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Stores created before retry backoff existed
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "not_before" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+
+    def conn(self):
+        # sqlite3 connections are per-thread; WAL lets readers run alongside the single writer
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["artifacts"] = json.loads(job["artifacts"] or "{}")
+        return job
+
+    def enqueue(self, session_id, stage, artifacts=None):
+        """Adds a pending job unless the session already has one for this stage."""
+        now = time.time()
+        cur = self.conn().execute(
+            "INSERT OR IGNORE INTO jobs (session_id, stage, artifacts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, stage, json.dumps(artifacts or {}), now, now)
+        )
+        if cur.rowcount:
+            logger.info(f"Queued {stage} for {session_id}")
+            self.notify(stage)
+        return bool(cur.rowcount)
+
+    def generation(self, stage) -> int:
+        """Read before claim(); pass to wait() so a job queued in between isn't missed."""
+        with self.wakeup:
+            return self.generations.get(stage, 0)
+
+    def notify(self, stage):
+        with self.wakeup:
+            self.generations[stage] = self.generations.get(stage, 0) + 1
+            self.wakeup.notify_all()
+
+    def next_due(self, stage) -> Optional[float]:
+        """When the earliest pending job of `stage` that is backing off becomes claimable, if any."""
+        row = self.conn().execute(
+            "SELECT MIN(not_before) FROM jobs WHERE stage = ? AND status = 'pending' AND not_before > ?",
+            (stage, time.time())
+        ).fetchone()
+        return row[0]
+
+    def wait(self, stage, seen, timeout=None) -> bool:
+        """Blocks until a job is queued for `stage` after generation `seen`, a backed-off job is due, or timeout."""
+        due = self.next_due(stage)
+        if due is not None:
+            delay = max(0.0, due - time.time())
+            timeout = delay if timeout is None else min(timeout, delay)
+        with self.wakeup:
+            return self.wakeup.wait_for(lambda: self.generations.get(stage, 0) != seen, timeout)
+
+    def claim(self, stage, worker=None) -> Optional[Dict[str, Any]]:
+        """Atomically moves the oldest claimable pending job of a stage to 'running' and returns it."""
+        conn = self.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE stage = ? AND status = 'pending' AND not_before <= ? "
+                "ORDER BY created_at LIMIT 1",
+                (stage, time.time())
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, error = NULL, "
+                "started_at = ?, updated_at = ? WHERE session_id = ? AND stage = ?",
+                (worker or threading.current_thread().name, now, now, row["session_id"], stage)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = self.row_to_job(row)
+        job["status"] = "running"
+        job["attempts"] += 1
+        return job
+
+    def complete(self, session_id, stage, artifacts=None, next_stage=None, requires=()):
+        """
+        Marks a job done, merging artifacts; optionally enqueues the next stage in the same transaction.
+        `requires` makes the next stage a join of parallel stages: it is only enqueued once those
+        are done too, carrying their artifacts as well. Whichever stage finishes last enqueues it.
+        """
+        conn = self.conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT artifacts FROM jobs WHERE session_id = ? AND stage = ?",
+                               (session_id, stage)).fetchone()
+            merged = json.loads(row["artifacts"]) if row else {}
+            merged.update(artifacts or {})
+            conn.execute(
+                "INSERT INTO jobs (session_id, stage, status, artifacts, created_at, updated_at, finished_at) "
+                "VALUES (?, ?, 'done', ?, ?, ?, ?) "
+                "ON CONFLICT (session_id, stage) DO UPDATE SET status = 'done', artifacts = excluded.artifacts, "
+                "updated_at = excluded.updated_at, finished_at = excluded.finished_at",
+                (session_id, stage, json.dumps(merged), now, now, now)
+            )
+            next_artifacts = {}
+            for other in requires:
+                row = conn.execute("SELECT status, artifacts FROM jobs WHERE session_id = ? AND stage = ?",
+                                   (session_id, other)).fetchone()
+                if row is None or row["status"] != "done":
+                    next_stage = None # The other stage enqueues it when it finishes
+                    break
+                next_artifacts.update(json.loads(row["artifacts"]))
+            next_artifacts.update(merged)
+            if next_stage:
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (session_id, stage, artifacts, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, next_stage, json.dumps(next_artifacts), now, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if next_stage:
+            self.notify(next_stage)
+
+    def fail(self, session_id, stage, error, retry=True, count=True):
+        """
+        Records a failure; the job goes back to pending until JOB_MAX_ATTEMPTS is reached,
+        claimable again after an exponential backoff so a transient error isn't retried
+        (and the attempts used up) straight away.
+        `count=False` is for outages outside the job itself (platform down, login failed):
+        it is retried after the backoff without using up an attempt, however long that takes.
+        """
+        conn = self.conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT attempts FROM jobs WHERE session_id = ? AND stage = ?",
+                               (session_id, stage)).fetchone()
+            attempts = row["attempts"] if row else 0
+            delay = min(settings.JOB_RETRY_MAX, settings.JOB_RETRY_BASE * 2 ** max(0, attempts - 1))
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND (NOT ? OR attempts < ?) THEN 'pending' ELSE 'failed' END, "
+                "attempts = attempts - CASE WHEN ? THEN 0 ELSE 1 END, "
+                "error = ?, not_before = ?, updated_at = ?, finished_at = ? WHERE session_id = ? AND stage = ?",
+                (retry, count, settings.JOB_MAX_ATTEMPTS, count, str(error), now + delay, now, now, session_id, stage)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def recover(self):
+        """
+        At startup: jobs left 'running' by a crash go back to pending, and failed jobs get
+        a fresh set of attempts (whatever made them fail may have been fixed meanwhile).
+        """
+        cur = self.conn().execute(
+            "UPDATE jobs SET status = 'pending', updated_at = ? WHERE status = 'running'", (time.time(),)
+        )
+        if cur.rowcount:
+            logger.warning(f"Recovered {cur.rowcount} interrupted jobs")
+            for stage in STAGES:
+                self.notify(stage)
+        self.retry_failed()
+
+    def retry_failed(self, session_id=None, stage=None) -> int:
+        """Puts failed jobs (optionally only one session / stage) back to pending with their attempts reset."""
+        query = "UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0, updated_at = ? WHERE status = 'failed'"
+        params = [time.time()]
+        if session_id:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        if stage:
+            query += " AND stage = ?"
+            params.append(stage)
+        cur = self.conn().execute(query, params)
+        if cur.rowcount:
+            logger.info(f"Retrying {cur.rowcount} failed jobs")
+            for s in ([stage] if stage else STAGES):
+                self.notify(s)
+        return cur.rowcount
+
+    def get(self, session_id, stage) -> Optional[Dict[str, Any]]:
+        row = self.conn().execute("SELECT * FROM jobs WHERE session_id = ? AND stage = ?",
+                                  (session_id, stage)).fetchone()
+        return self.row_to_job(row)
+
+    def count(self, stage, status) -> int:
+        return self.conn().execute("SELECT COUNT(*) FROM jobs WHERE stage = ? AND status = ?",
+                                   (stage, status)).fetchone()[0]
+
+    def list_jobs(self, limit=100) -> List[Dict[str, Any]]:
+        rows = self.conn().execute("SELECT * FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.row_to_job(r) for r in rows]
+
+job_store = JobStore(settings.JOB_DB_PATH)
@@ -14,7 +14,11 @@ from fastapi.responses import FileResponse, RedirectResponse
 from .ingest import ingest_service
 from .pipeline.stitcher import stitcher_service
 from .pipeline.ml import ml_service
+from .pipeline.panorama import panorama_service
 from .upload import upload_service
+from .jobs import job_store
+from .events import file_watcher
+from .config import settings
 
 # Setup Logging
 logging.basicConfig(
@@ -39,6 +43,13 @@ class ServiceManager:
         logger.info("Starting Background Services...")
         self.running = True
         
+        # Anything left 'running' by a crash is picked up again
+        job_store.recover()
+        
+        # Stages hand off through the job store / event bus; the watcher only
+        # catches footage copied into the storage dirs by hand
+        file_watcher.start([settings.RAW_STORAGE_DIR, settings.PROCESSED_STORAGE_DIR])
+        
         # Start Ingest
         t_ingest = threading.Thread(target=self.run_ingest, daemon=True)
         self.threads.append(t_ingest)
@@ -61,6 +72,7 @@ class ServiceManager:
     def stop(self):
         logger.info("Stopping Services...")
         self.running = False
+        file_watcher.stop()
             
     def run_ingest(self):
         ingest_service.running_loop()
@@ -102,5 +114,24 @@ async def get_status():
         "disk_free_gb": 500 # Mock
     }
 
+@app.get("/api/jobs")
+async def get_jobs(limit: int = 100):
+    return {"jobs": job_store.list_jobs(limit)}
+
+@app.post("/api/jobs/retry")
+async def retry_jobs(session_id: str = None, stage: str = None):
+    # Failed jobs (all, or one session / stage) get a fresh set of attempts
+    return {"retried": job_store.retry_failed(session_id, stage)}
+
+@app.get("/api/calibration")
+async def get_calibration():
+    return {"calibrations": panorama_service.calibrations}
+
+@app.post("/api/calibration/reset")
+async def reset_calibration(rig_key: str = None):
+    # After re-aiming the cameras; the next panorama stitch recalibrates
+    panorama_service.forget(rig_key)
+    return {"status": "reset"}
+
 if __name__ == "__main__":
     uvicorn.run("soccer_bench.main:app", host="0.0.0.0", port=4421, reload=True)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import shutil
+import socket
+import hashlib
+import logging
+import argparse
+import importlib.util
+import threading
+import cv2
+from ultralytics import YOLO
+from ultralytics.utils.downloads import attempt_download_asset
+from ..config import settings
+
+logger = logging.getLogger("ModelBackends")
+
+# Runtimes the detector can be exported to, in the order tried when nothing has been benchmarked.
+# "module" has to be importable for the backend to be usable at all.
+BACKENDS = {
+    "openvino": {"format": "openvino", "module": "openvino", "int8": True},
+    "onnx": {"format": "onnx", "module": "onnxruntime", "int8": False},
+    "torch": {"format": None, "module": "torch", "int8": False},
+}
+
+class ModelBackends:
+    """
+    Exports the YOLO weights once per runtime (optionally INT8) and caches the artifact under
+    MODEL_CACHE_DIR, keyed by weights hash and input size, so a changed model or imgsz re-exports.
+    `benchmark` times every backend on a reference clip; `load` then picks the fastest.
+    """
+    def __init__(self):
+        self.active = None
+        self.version = None # identifies the weights + export the active model produces results from
+        self.bench = None
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def get_status(self):
+        return {
+            "backend": self.active,
+            "int8": settings.ML_INT8,
+            "benchmark": self.bench["fps"] if self.bench else None
+        }
+
+    def available(self):
+        return [name for name, spec in BACKENDS.items() if importlib.util.find_spec(spec["module"])]
+
+    def model_hash(self, model_path):
+        stamp = (model_path, os.path.getmtime(model_path))
+        if stamp not in self.hashes:
+            digest = hashlib.sha256()
+            with open(model_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self.hashes[stamp] = digest.hexdigest()
+        return self.hashes[stamp]
+
+    def int8(self, backend):
+        return settings.ML_INT8 and BACKENDS[backend]["int8"]
+
+    def artifact_path(self, model_path, backend):
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        name = f"{stem}-{self.model_hash(model_path)[:12]}-{settings.ML_IMGSZ}" + ("-int8" if self.int8(backend) else "")
+        # Ultralytics recognises the runtime from the file name
+        if backend == "openvino":
+            return os.path.join(settings.MODEL_CACHE_DIR, f"{name}_openvino_model")
+        return os.path.join(settings.MODEL_CACHE_DIR, f"{name}.onnx")
+
+    def export(self, model_path, backend):
+        """Path to the cached export of `model_path` for `backend`, exporting it first if needed."""
+        if backend == "torch":
+            return model_path
+        target = self.artifact_path(model_path, backend)
+        if os.path.exists(target):
+            return target
+        int8 = self.int8(backend)
+        logger.info(f"Exporting {model_path} to {backend}{' (INT8)' if int8 else ''}...")
+        exported = YOLO(model_path).export(
+            format=BACKENDS[backend]["format"], imgsz=settings.ML_IMGSZ, dynamic=True, # dynamic batch
+            int8=int8, data=settings.ML_INT8_DATA if int8 else None, verbose=False
+        )
+        os.makedirs(settings.MODEL_CACHE_DIR, exist_ok=True)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.move(str(exported), target)
+        return target
+
+    def bench_key(self, model_path):
+        return f"{socket.gethostname()}|{self.model_hash(model_path)}|{settings.ML_IMGSZ}|{settings.ML_INT8}"
+
+    def load_bench(self, model_path):
+        if not os.path.exists(settings.MODEL_BENCH_PATH):
+            return None
+        try:
+            with open(settings.MODEL_BENCH_PATH, "r") as f:
+                cached = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable backend benchmark: {e}")
+            return None
+        return cached if cached.get("key") == self.bench_key(model_path) else None
+
+    def ranked(self, model_path):
+        """Backends to try in order: the one forced by ML_BACKEND, else benchmarked fastest-first."""
+        available = self.available()
+        if settings.ML_BACKEND != "auto":
+            return [settings.ML_BACKEND] + (["torch"] if settings.ML_BACKEND != "torch" else [])
+        self.bench = self.load_bench(model_path)
+        if not self.bench:
+            return available
+        fps = self.bench["fps"]
+        return sorted(available, key=lambda name: -(fps.get(name) or 0))
+
+    def load(self, model_path):
+        """Loads the fastest usable backend, falling back down the list if an export or load fails."""
+        with self.lock:
+            model_path = attempt_download_asset(model_path) # Hashing and exporting need the weights on disk
+            for backend in self.ranked(model_path):
+                try:
+                    model = YOLO(self.export(model_path, backend), task="detect")
+                except Exception as e:
+                    logger.warning(f"Backend {backend} unavailable: {e}")
+                    continue
+                self.active = backend
+                self.version = f"{self.model_hash(model_path)[:12]}-{settings.ML_IMGSZ}" + ("-int8" if self.int8(backend) else "")
+                logger.info(f"Inference backend: {backend}")
+                return model
+            raise RuntimeError(f"No inference backend could load {model_path}")
+
+    def benchmark(self, model_path, clip, frames=64, batch_size=None):
+        """Frames per second of each available backend over the first `frames` frames of `clip`."""
+        batch_size = batch_size or settings.ML_BATCH_SIZE
+        model_path = attempt_download_asset(model_path)
+        cap = cv2.VideoCapture(clip)
+        images = []
+        while len(images) < frames:
+            ret, frame = cap.read()
+            if not ret: break
+            images.append(frame)
+        cap.release()
+        if not images:
+            raise RuntimeError(f"No frames decoded from {clip}")
+
+        fps = {}
+        for backend in self.available():
+            try:
+                model = YOLO(self.export(model_path, backend), task="detect")
+                model(images[:batch_size], imgsz=settings.ML_IMGSZ, verbose=False) # warm-up
+                start = time.time()
+                for i in range(0, len(images), batch_size):
+                    model(images[i:i + batch_size], imgsz=settings.ML_IMGSZ, verbose=False)
+                fps[backend] = round(len(images) / (time.time() - start), 1)
+            except Exception as e:
+                logger.warning(f"Backend {backend} failed benchmark: {e}")
+                fps[backend] = None
+            logger.info(f"Backend {backend}: {fps[backend] or 'unavailable'} fps")
+
+        self.bench = {"key": self.bench_key(model_path), "fps": fps, "clip": clip,
+                      "frames": len(images), "benchmarked_at": time.time()}
+        os.makedirs(os.path.dirname(settings.MODEL_BENCH_PATH), exist_ok=True)
+        with open(settings.MODEL_BENCH_PATH, "w") as f:
+            json.dump(self.bench, f, indent=2)
+        return fps
+
+model_backends = ModelBackends()
+
+if __name__ == "__main__":
+    # python -m soccer_bench.pipeline.backends <clip> [--model yolov8m.pt] [--frames 64]
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compare inference backends on a reference clip")
+    parser.add_argument("clip")
+    parser.add_argument("--model", default="yolov8m.pt")
+    parser.add_argument("--frames", type=int, default=64)
+    args = parser.parse_args()
+
+    results = model_backends.benchmark(args.model, args.clip, args.frames)
+    for backend, fps in sorted(results.items(), key=lambda kv: -(kv[1] or 0)):
+        print(f"{backend:10s} {fps if fps else 'failed'}")
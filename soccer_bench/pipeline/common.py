@@ -0,0 +1,55 @@
+from queue import Full
+import numpy as np
+
+# Camera roles, left to right across the rig; stitch inputs and per-camera outputs use this order
+ROLES = ("CAM_L", "CAM_C", "CAM_R")
+PERSON, BALL = 0, 32 # COCO classes
+
+def put(queue, item, stop):
+    """Blocking put that gives up once `stop` is set, so a producer can't hang on a consumer that bailed out."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.5)
+            return
+        except Full:
+            continue
+
+def sampled_frames(cap, skip_frames, start_frame=0, frame_idx=0):
+    """
+    Yields (frame_idx, frame) for every `skip_frames`-th frame from `start_frame`, reading `cap`
+    from its current position, which is frame `frame_idx`.
+    grab() skips colour conversion and the copy; only sampled frames are retrieved.
+    """
+    while cap.isOpened():
+        if not cap.grab():
+            return
+        if frame_idx >= start_frame and (frame_idx - start_frame) % skip_frames == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                return
+            yield frame_idx, frame
+        frame_idx += 1
+
+def summarize_detections(data):
+    """
+    Reduces one frame's detections in bulk: player count and centroids, and the most
+    confident ball box. `data` is the (N, 6) x1, y1, x2, y2, conf, cls array of Boxes.data.
+    """
+    cls = data[:, 5].astype(int)
+    conf = data[:, 4]
+    xywh = np.column_stack([(data[:, 0] + data[:, 2]) / 2, (data[:, 1] + data[:, 3]) / 2,
+                            data[:, 2] - data[:, 0], data[:, 3] - data[:, 1]]).round(1)
+
+    players = cls == PERSON
+    balls = np.flatnonzero(cls == BALL)
+    ball_coords = None
+    if balls.size:
+        best = balls[conf[balls].argmax()]
+        x, y, w, h = xywh[best].tolist()
+        ball_coords = {"x": x, "y": y, "w": w, "h": h, "confidence": round(float(conf[best]), 3)}
+    return {
+        "players": int(players.sum()),
+        "ball_detected": ball_coords is not None,
+        "ball_coords": ball_coords,
+        "player_positions": xywh[players, :2].tolist() # (x, y) centroids in pixels
+    }
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import socket
+import logging
+import subprocess
+import tempfile
+import threading
+from ..config import settings
+
+logger = logging.getLogger("EncoderProbe")
+
+# Candidate encoders per output codec, with the ffmpeg arguments each one needs.
+# "global" goes before the inputs, "filter" is appended to the filter graph output.
+ENCODERS = {
+    "h264_nvenc": {"codec": "h264", "args": ["-c:v", "h264_nvenc", "-preset", "p4", "-cq", "23"]},
+    "hevc_nvenc": {"codec": "hevc", "args": ["-c:v", "hevc_nvenc", "-preset", "p4", "-cq", "26"]},
+    "h264_qsv": {"codec": "h264", "args": ["-c:v", "h264_qsv", "-preset", "veryfast", "-global_quality", "23"],
+                 "filter": "format=nv12"},
+    "hevc_qsv": {"codec": "hevc", "args": ["-c:v", "hevc_qsv", "-preset", "veryfast", "-global_quality", "26"],
+                 "filter": "format=nv12"},
+    "h264_vaapi": {"codec": "h264", "args": ["-c:v", "h264_vaapi", "-qp", "23"],
+                   "global": ["-vaapi_device", "/dev/dri/renderD128"], "filter": "format=nv12,hwupload"},
+    "hevc_vaapi": {"codec": "hevc", "args": ["-c:v", "hevc_vaapi", "-qp", "26"],
+                   "global": ["-vaapi_device", "/dev/dri/renderD128"], "filter": "format=nv12,hwupload"},
+    "libx264": {"codec": "h264", "args": ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"]},
+    "libx265": {"codec": "hevc", "args": ["-c:v", "libx265", "-preset", "ultrafast", "-crf", "26"]},
+}
+
+# Always-available fallback per codec if probing fails entirely
+CPU_FALLBACK = {"h264": "libx264", "hevc": "libx265"}
+
+# Hardware decoders worth trying for the HEVC camera inputs.
+# "scale" keeps frames on the device so "filter" can downscale them there before download.
+DECODERS = {
+    "cuda": {"args": ["-hwaccel", "cuda"], "scale": ["-hwaccel_output_format", "cuda"],
+             "filter": "scale_cuda={w}:{h},hwdownload,format=nv12"},
+    "qsv": {"args": ["-hwaccel", "qsv"], "scale": ["-hwaccel_output_format", "qsv"],
+            "filter": "scale_qsv=w={w}:h={h},hwdownload,format=nv12"},
+    "vaapi": {"args": ["-hwaccel", "vaapi"], "scale": ["-hwaccel_output_format", "vaapi"],
+              "filter": "scale_vaapi=w={w}:h={h},hwdownload,format=nv12"},
+}
+
+BENCH_FRAMES = 60
+
+class EncoderProbe:
+    """
+    Finds the fastest working encoder / decoder on this host.
+    Lists what ffmpeg was built with, then runs a short benchmark of each candidate
+    (a listed encoder can still fail, e.g. NVENC without a GPU) and caches the result
+    per host + ffmpeg build so later starts skip the benchmark.
+    """
+    def __init__(self):
+        self.result = None
+        self.lock = threading.Lock()
+
+    def get_status(self):
+        if not self.result:
+            return {"status": "not_probed"}
+        return {
+            "encoder": self.result["encoder"],
+            "encoder_fps": self.result["encoder_fps"],
+            "hwaccel": self.result["hwaccel"],
+            "decode_fps": self.result["decode_fps"],
+            "probed_at": self.result["probed_at"]
+        }
+
+    def run(self, args, timeout=60):
+        return subprocess.run(["ffmpeg", "-hide_banner", *args], capture_output=True, text=True, timeout=timeout)
+
+    def ffmpeg_version(self):
+        return self.run(["-version"]).stdout.splitlines()[0]
+
+    def listed_encoders(self):
+        out = self.run(["-encoders"]).stdout
+        names = set()
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].startswith("V"):
+                names.add(parts[1])
+        return names
+
+    def listed_hwaccels(self):
+        out = self.run(["-hwaccels"]).stdout
+        return {line.strip() for line in out.splitlines()[1:] if line.strip()}
+
+    def timed(self, args):
+        """Runs ffmpeg and returns frames per second over BENCH_FRAMES, or None on failure."""
+        start = time.time()
+        try:
+            proc = self.run(args)
+        except subprocess.TimeoutExpired:
+            return None
+        if proc.returncode != 0:
+            return None
+        return round(BENCH_FRAMES / max(time.time() - start, 1e-3), 1)
+
+    def bench_encoder(self, name, out_path):
+        spec = ENCODERS[name]
+        vf = "format=yuv420p" + ("," + spec["filter"] if spec.get("filter") else "")
+        return self.timed([
+            "-y", *spec.get("global", []),
+            "-f", "lavfi", "-i", f"testsrc2=size={settings.ENCODER_BENCH_SIZE}:rate=30",
+            "-frames:v", str(BENCH_FRAMES), "-vf", vf, *spec["args"], out_path
+        ])
+
+    def bench_decoder(self, hwaccel, clip):
+        args = DECODERS[hwaccel]["args"] if hwaccel else []
+        return self.timed([*args, "-i", clip, "-f", "null", "-"])
+
+    def probe(self):
+        encoders = self.listed_encoders()
+        hwaccels = self.listed_hwaccels()
+        codec = settings.STITCH_CODEC
+        candidates = [n for n, spec in ENCODERS.items() if n in encoders and (codec == "any" or spec["codec"] == codec)]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            encoder_fps = {}
+            for name in candidates:
+                fps = self.bench_encoder(name, os.path.join(tmp, f"{name}.mp4"))
+                logger.info(f"Encoder {name}: {fps if fps else 'unavailable'} fps")
+                if fps:
+                    encoder_fps[name] = fps
+
+            # Decode benchmark on an HEVC clip, like the camera files
+            decode_fps = {}
+            clip = os.path.join(tmp, "libx265.mp4")
+            if "libx265" in encoders and (os.path.exists(clip) or self.bench_encoder("libx265", clip)):
+                for hwaccel in [None] + [h for h in DECODERS if h in hwaccels]:
+                    fps = self.bench_decoder(hwaccel, clip)
+                    logger.info(f"Decoder {hwaccel or 'software'}: {fps if fps else 'unavailable'} fps")
+                    if fps:
+                        decode_fps[hwaccel or "software"] = fps
+
+        fallback = CPU_FALLBACK.get(codec, "libx264")
+        best_encoder = max(encoder_fps, key=encoder_fps.get) if encoder_fps else fallback
+        best_decoder = max(decode_fps, key=decode_fps.get) if decode_fps else "software"
+        return {
+            "encoder": best_encoder,
+            "encoder_fps": encoder_fps.get(best_encoder),
+            "hwaccel": None if best_decoder == "software" else best_decoder,
+            "decode_fps": decode_fps.get(best_decoder),
+            "candidates": {"encoders": encoder_fps, "decoders": decode_fps},
+            "codec": codec,
+            "probed_at": time.time()
+        }
+
+    def ensure(self):
+        """Loads the cached probe for this host/ffmpeg build, or benchmarks and caches it."""
+        with self.lock:
+            if self.result:
+                return self.result
+            try:
+                key = f"{socket.gethostname()}|{self.ffmpeg_version()}|{settings.STITCH_CODEC}"
+            except (OSError, IndexError) as e:
+                logger.error(f"ffmpeg not usable, defaulting to CPU encoder: {e}")
+                self.result = self.fallback()
+                return self.result
+
+            cache_path = settings.ENCODER_CACHE_PATH
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, "r") as f:
+                        cached = json.load(f)
+                    if cached.get("key") == key:
+                        self.result = cached
+                        logger.info(f"Using cached encoder probe: {cached['encoder']} / {cached['hwaccel'] or 'software'} decode")
+                        return self.result
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable encoder cache: {e}")
+
+            logger.info("Probing encoders and decoders...")
+            result = self.probe()
+            result["key"] = key
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with open(cache_path, "w") as f:
+                    json.dump(result, f, indent=2)
+            except OSError as e:
+                logger.warning(f"Could not cache encoder probe: {e}")
+            logger.info(f"Selected encoder {result['encoder']} ({result['encoder_fps']} fps), "
+                        f"decoder {result['hwaccel'] or 'software'} ({result['decode_fps']} fps)")
+            self.result = result
+            return self.result
+
+    def fallback(self):
+        return {"encoder": CPU_FALLBACK.get(settings.STITCH_CODEC, "libx264"), "encoder_fps": None,
+                "hwaccel": None, "decode_fps": None, "candidates": {}, "probed_at": time.time()}
+
+    def encoder_spec(self):
+        return ENCODERS[self.ensure()["encoder"]]
+
+    def hwaccel(self):
+        return self.ensure()["hwaccel"]
+
+    def decode_options(self, width=None, height=-2):
+        """
+        Per-input decoder args, plus the filter that brings a decoded frame down to `width`
+        (None = native size) and `height` (default: keep aspect). With a hardware decoder the downscale happens on the device,
+        so full 4K frames never cross to system memory; in software it's a fast swscale
+        straight after decode. HEVC has no lowres decoding, so this is as early as it gets.
+        """
+        hwaccel = self.hwaccel() if settings.STITCH_HWACCEL_DECODE else None
+        if not hwaccel:
+            return [], f"scale={width}:{height}:flags=fast_bilinear" if width else None
+        spec = DECODERS[hwaccel]
+        if not width:
+            return spec["args"], None # Frames are downloaded to system memory automatically
+        return spec["args"] + spec["scale"], spec["filter"].format(w=width, h=height)
+
+encoder_probe = EncoderProbe()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import logging
+import subprocess
+from ..config import settings
+
+logger = logging.getLogger("Ladder")
+
+# Forced keyframes on a fixed grid line segment boundaries up across every rendition
+KEYFRAME_ARGS = ["-force_key_frames", "expr:gte(t,n_forced*1)"]
+
+def even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+def ladder_rungs(out_height):
+    """
+    Heights encoded alongside the main output. The top of the ladder is the main output
+    itself (repackaged later without re-encoding), so only smaller rungs are listed.
+    """
+    if not settings.STITCH_HLS:
+        return []
+    if not out_height:
+        return sorted(settings.HLS_LADDER, reverse=True)[1:]
+    return sorted((h for h in settings.HLS_LADDER if h < out_height), reverse=True)
+
+def split_outputs(graph, encoder_filter, rungs):
+    """
+    Finishes a filter graph ending in the stitched frame: one [v] branch for the main output,
+    plus [r<height>] per rung scaled from the same decoded frames via split.
+    The encoder's own filter (e.g. hwupload) goes on every branch, after scaling.
+    """
+    tail = "," + encoder_filter if encoder_filter else ""
+    if not rungs:
+        return graph + tail + "[v]"
+    graph += f",split={len(rungs) + 1}[main]" + "".join(f"[s{h}]" for h in rungs)
+    graph += f";[main]{encoder_filter or 'null'}[v]"
+    for h in rungs:
+        graph += f";[s{h}]scale=-2:{h}{tail}[r{h}]"
+    return graph
+
+def segment_args(codec, rung_dir):
+    """
+    Segment container for `codec`. HEVC goes in fMP4 tagged hvc1, since Apple players
+    reject HEVC in MPEG-TS (and the hev1 tag); H.264 stays in MPEG-TS.
+    """
+    if codec == "hevc":
+        return ["-tag:v", "hvc1", "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+                "-hls_segment_filename", os.path.join(rung_dir, "seg_%05d.m4s")]
+    return ["-hls_segment_filename", os.path.join(rung_dir, "seg_%05d.ts")]
+
+def hls_output_args(rungs, encoder_args, threads, hls_dir, codec):
+    """A single HLS output carrying every rung as its own variant stream."""
+    if not rungs:
+        return []
+    args = []
+    for h in rungs:
+        args += ["-map", f"[r{h}]"]
+    args += [
+        *encoder_args, "-threads", str(threads), *KEYFRAME_ARGS,
+        "-f", "hls",
+        "-hls_time", str(settings.HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-var_stream_map", " ".join(f"v:{i},name:{h}p" for i, h in enumerate(rungs)),
+        *segment_args(codec, os.path.join(hls_dir, "%v")),
+        os.path.join(hls_dir, "%v", "index.m3u8")
+    ]
+    return args
+
+def prepare(hls_dir):
+    """Clears output from an earlier (failed) attempt; ffmpeg creates the rung directories."""
+    shutil.rmtree(hls_dir, ignore_errors=True)
+    os.makedirs(hls_dir)
+
+def rung_bandwidth(playlist):
+    """Peak segment bitrate of a rendition, which is what BANDWIDTH means in a master playlist."""
+    rung_dir = os.path.dirname(playlist)
+    peak, duration = 0, None
+    with open(playlist, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration:
+                size = os.path.getsize(os.path.join(rung_dir, line))
+                peak = max(peak, int(size * 8 / duration))
+    return peak
+
+def package(session_id, video_path, hls_dir, out_size, rungs, codec):
+    """
+    Adds the main output as the top rung (remuxed with -c copy, no decode) and writes
+    master.m3u8 over all rungs. Returns the master playlist path.
+    """
+    out_w, out_h = out_size
+    top = f"{out_h}p"
+    os.makedirs(os.path.join(hls_dir, top), exist_ok=True)
+    subprocess.run(
+        ["ffmpeg", "-y", "-i", video_path, "-map", "0:v", "-c", "copy",
+         "-f", "hls", "-hls_time", str(settings.HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+         *segment_args(codec, os.path.join(hls_dir, top)),
+         os.path.join(hls_dir, top, "index.m3u8")],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7" if codec == "hevc" else "#EXT-X-VERSION:3"] # fMP4 needs v7
+    for h in [out_h] + rungs:
+        name = f"{h}p"
+        bandwidth = rung_bandwidth(os.path.join(hls_dir, name, "index.m3u8"))
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={even(out_w * h / out_h)}x{h}")
+        lines.append(f"{name}/index.m3u8")
+    master = os.path.join(hls_dir, "master.m3u8")
+    with open(master, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    logger.info(f"HLS ladder for {session_id}: {', '.join(f'{h}p' for h in [out_h] + rungs)}")
+    return master
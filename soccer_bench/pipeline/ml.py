@@ -2,13 +2,127 @@ import logging
 import os
 import cv2
 import json
+import numpy as np
 import time
-from ultralytics import YOLO
+import threading
+import multiprocessing
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from ..config import settings
+from ..jobs import job_store
+from .backends import model_backends
+from .stitcher import stitcher_service
+from .common import ROLES, PERSON, BALL, put, sampled_frames, summarize_detections
 
 logger = logging.getLogger("ML_Analysis")
 
+SKIP_FRAMES = 10 # Analyze every 10th frame (3fps effective analysis)
+
+def tile_origins(length, tile, overlap):
+    """Start offsets along one axis so tiles of `tile` px overlap by at least `overlap` and reach the far edge."""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, stride))
+    return starts + [length - tile]
+
+def crop_around(frame, center, tile):
+    """A tile x tile view centred on `center`, clamped inside the frame. Returns (crop, (x0, y0))."""
+    h, w = frame.shape[:2]
+    x0 = int(min(max(center[0] - tile / 2, 0), max(w - tile, 0)))
+    y0 = int(min(max(center[1] - tile / 2, 0), max(h - tile, 0)))
+    return frame[y0:y0 + tile, x0:x0 + tile], (x0, y0)
+
+def project_boxes(data, matrix):
+    """Boxes through a 3x3 homography: the axis-aligned bounds of each warped box."""
+    if not len(data):
+        return data
+    x1, y1, x2, y2 = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+    corners = np.stack([np.column_stack(c) for c in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))], axis=1)
+    warped = cv2.perspectiveTransform(corners.reshape(-1, 1, 2).astype(np.float64), matrix).reshape(-1, 4, 2)
+    out = data.copy()
+    out[:, :2], out[:, 2:4] = warped.min(axis=1), warped.max(axis=1)
+    return out
+
+def input_size(video_path):
+    """Bytes behind a video input; a concat: input (segmented recording) is the sum of its segments."""
+    if video_path.startswith("concat:"):
+        return sum(os.path.getsize(p) for p in video_path[len("concat:"):].split("|"))
+    return os.path.getsize(video_path)
+
+def analyze_camera(model_path, video_path, start_frame, out_path, threads, version):
+    """
+    Worker process: raw detections for one camera, one JSON line per sampled frame.
+    Frame indices count from `start_frame` (the camera's sync trim), so they line up with the stitched output.
+    Checkpointed like analyze_video, under its own `.partial` / `.ckpt` keyed on this camera file and
+    `version`; a finished file keeps its checkpoint until the parent has merged it, so it isn't redone.
+    Returns the camera's native size and frame rate.
+    """
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    service = MLService()
+    service.model_path = model_path
+    cap = service.open_capture(video_path)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    partial, checkpoint_path = out_path + ".partial", out_path + ".ckpt"
+    if os.path.exists(out_path) and service.load_checkpoint(checkpoint_path, out_path, video_path, version):
+        cap.release()
+        return size, fps # Done before a restart; only the merge is left
+    resume_from = service.resume_point(partial, checkpoint_path, video_path, version)
+    if resume_from:
+        logger.info(f"Resuming {os.path.basename(video_path)} from frame {resume_from}")
+    service.load_model()
+
+    last_frame, last_saved = resume_from - SKIP_FRAMES, time.time()
+    with open(partial, "a" if resume_from else "w") as f:
+        def write(batch):
+            nonlocal last_frame, last_saved
+            detections = service.infer_batch(batch)
+            f.write("".join(json.dumps({"frame": frame_idx, "boxes": data.round(1).tolist()}) + "\n"
+                            for (frame_idx, _), data in zip(batch, detections)))
+            last_frame = batch[-1][0]
+            if time.time() - last_saved >= settings.ML_CHECKPOINT_INTERVAL:
+                service.save_checkpoint(checkpoint_path, f, last_frame, video_path, version)
+                last_saved = time.time()
+            return len(batch)
+        # Camera files are raw H.265 (or concat: of segments); seeks there aren't frame-accurate
+        service.scan(cap, write, start_frame=start_frame, resume_from=resume_from, seekable=False)
+        service.save_checkpoint(checkpoint_path, f, last_frame, video_path, version)
+    os.replace(partial, out_path)
+    return size, fps
+
+def merge_detections(parts, threshold):
+    """
+    Cross-tile NMS. `parts` are (data, (x0, y0)) pairs in tile coordinates; boxes are shifted into
+    frame coordinates and, per class, a box is dropped when a more confident one covers more than
+    `threshold` of the smaller of the two. Intersection-over-smaller (rather than IoU) is what
+    catches an object cut at a tile edge alongside its whole copy from the neighbouring tile.
+    """
+    shifted = [d + np.array([x0, y0, x0, y0, 0, 0], dtype=d.dtype) for d, (x0, y0) in parts if len(d)]
+    if not shifted:
+        return np.zeros((0, 6), dtype=np.float32)
+    data = np.concatenate(shifted)
+    data = data[np.argsort(-data[:, 4])]
+    area = (data[:, 2] - data[:, 0]) * (data[:, 3] - data[:, 1])
+
+    keep = np.ones(len(data), dtype=bool)
+    for i in range(len(data)):
+        if not keep[i]:
+            continue
+        rest = np.flatnonzero(keep[i + 1:] & (data[i + 1:, 5] == data[i, 5])) + i + 1
+        if not rest.size:
+            continue
+        iw = np.minimum(data[i, 2], data[rest, 2]) - np.maximum(data[i, 0], data[rest, 0])
+        ih = np.minimum(data[i, 3], data[rest, 3]) - np.maximum(data[i, 1], data[rest, 1])
+        inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+        overlap = inter / np.maximum(np.minimum(area[i], area[rest]), 1e-6)
+        keep[rest[overlap > threshold]] = False
+    return data[keep]
+
 class MLService:
     def __init__(self):
         self.model_path = "yolov8m.pt"
@@ -18,6 +132,12 @@ class MLService:
         self.progress = 0
         self.fps_processing = 0
         self.stats = {"players": 0, "ball": False}
+        self.batch_size = max(1, settings.ML_BATCH_SIZE)
+        self.batch_latency_ms = 0
+        self.inference_fps = 0
+        self.mode = settings.ML_INFERENCE_MODE
+        self.last_ball = None # (x, y) of the most recent ball detection, for roi mode
+        self.sampled = 0 # sampled frames seen this video, for roi keyframes
         
     def get_status(self):
         return {
@@ -25,6 +145,11 @@ class MLService:
             "file": self.current_file,
             "progress": self.progress,
             "fps": self.fps_processing,
+            "batch_size": self.batch_size,
+            "mode": self.mode,
+            "backend": model_backends.active,
+            "batch_latency_ms": self.batch_latency_ms, # last forward pass
+            "inference_fps": self.inference_fps, # frames per second of model time alone
             "stats": self.stats
         }
 
@@ -36,26 +161,41 @@ class MLService:
         if not self.model:
             self.status = "loading_model"
             logger.info(f"Loading YOLO model: {self.model_path}")
-            self.model = YOLO(self.model_path)
+            self.model = model_backends.load(self.model_path)
 
-    def scan_and_process(self):
-        in_dir = settings.PROCESSED_STORAGE_DIR
+    def process_job(self, job):
+        session_id = job["session_id"]
+        video_path = job["artifacts"].get("stitched") or os.path.join(
+            settings.PROCESSED_STORAGE_DIR, f"{session_id}_stitched.mp4")
         out_dir = settings.EVENTS_DIR
         self.ensure_dir(out_dir)
         
-        if not os.path.exists(in_dir): return
-
-        # Find stitched videos
-        files = [f for f in os.listdir(in_dir) if f.endswith("_stitched.mp4")]
+        base_name = os.path.basename(video_path).replace(".mp4", "")
+        event_file = os.path.join(out_dir, f"{base_name}_events.jsonl")
         
-        for vid_file in files:
-            base_name = vid_file.replace(".mp4", "")
-            event_file = os.path.join(out_dir, f"{base_name}_events.jsonl")
+        # Raw inputs are gone for sessions adopted from older outputs; those analyze the stitched video
+        session = None
+        if settings.ML_SOURCE == "cameras":
+            session = stitcher_service.session_sources(session_id)
+            if not session: # Right after a restart the raw index may not be built yet
+                stitcher_service.scan_for_sessions()
+                session = stitcher_service.session_sources(session_id)
+        if not session and not os.path.exists(video_path):
+            job_store.fail(session_id, "ml", f"missing video {video_path}", retry=False)
+            return
             
-            if os.path.exists(event_file):
-                continue # Already analyzed
-                
-            self.analyze_video(os.path.join(in_dir, vid_file), event_file)
+        try:
+            if session:
+                self.analyze_cameras(session_id, *session, event_file)
+            else:
+                self.analyze_video(video_path, event_file)
+        except Exception as e:
+            logger.error(f"Analysis failed for {session_id}: {e}")
+            job_store.fail(session_id, "ml", e)
+            self.status = "idle"
+            return
+        # In cameras mode stitching may still be running; it enqueues upload when it finishes instead
+        job_store.complete(session_id, "ml", {"events": event_file}, next_stage="upload", requires=["stitch"])
 
     def analyze_video(self, video_path, output_path):
         self.load_model()
@@ -63,72 +203,336 @@ class MLService:
         self.current_file = os.path.basename(video_path)
         logger.info(f"Starting Analysis on {self.current_file}...")
         
-        cap = cv2.VideoCapture(video_path)
+        # Events go to a .partial file that is renamed into place only when complete, so an
+        # events file on disk is always whole. The checkpoint says how much of the .partial is
+        # known-good, so a restart resumes there instead of redoing the inference.
+        partial, checkpoint_path = output_path + ".partial", output_path + ".ckpt"
+        version = f"{model_backends.version}|{self.mode}|{SKIP_FRAMES}"
+        resume_from = self.resume_point(partial, checkpoint_path, video_path, version)
+        if resume_from:
+            logger.info(f"Resuming {self.current_file} from frame {resume_from}")
+        
+        cap = self.open_capture(video_path)
         fps_video = cap.get(cv2.CAP_PROP_FPS)
+        last_saved = time.time()
+        with open(partial, "a" if resume_from else "w") as f:
+            def on_batch(batch):
+                nonlocal last_saved
+                count = self.run_batch(batch, fps_video, f)
+                if time.time() - last_saved >= settings.ML_CHECKPOINT_INTERVAL:
+                    self.save_checkpoint(checkpoint_path, f, batch[-1][0], video_path, version)
+                    last_saved = time.time()
+                return count
+            self.scan(cap, on_batch, resume_from=resume_from)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, output_path)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        logger.info(f"Analysis Complete: {output_path}")
+        self.status = "idle"
+        self.current_file = None
+        self.progress = 0
+
+    def load_checkpoint(self, path, partial, video_path, version):
+        """The checkpoint to resume from, or None if there is none or it's for another video / model."""
+        if not (os.path.exists(path) and os.path.exists(partial)):
+            return None
+        try:
+            with open(path, "r") as f:
+                checkpoint = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            return None
+        if checkpoint.get("version") != version or checkpoint.get("video_size") != input_size(video_path):
+            logger.info(f"Discarding checkpoint for {os.path.basename(video_path)}: video or model changed")
+            return None
+        if os.path.getsize(partial) < checkpoint["bytes"]:
+            return None # Events past the checkpoint were lost, e.g. on power loss
+        return checkpoint
+
+    def resume_point(self, partial, checkpoint_path, video_path, version):
+        """Trims `partial` back to its checkpoint; returns the sampled frame to resume from (0 to start over)."""
+        checkpoint = self.load_checkpoint(checkpoint_path, partial, video_path, version)
+        if checkpoint:
+            with open(partial, "r+b") as f:
+                f.truncate(checkpoint["bytes"]) # Lines written after the checkpoint are redone
+            return checkpoint["frame"] + SKIP_FRAMES
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return 0
+
+    def save_checkpoint(self, path, f, frame_idx, video_path, version):
+        """Records that `f` is complete up to and including sampled frame `frame_idx`."""
+        f.flush()
+        os.fsync(f.fileno()) # The checkpoint must never claim more than is on disk
+        checkpoint = {
+            "frame": frame_idx,
+            "bytes": f.tell(),
+            "version": version,
+            "video_size": input_size(video_path),
+            "saved_at": time.time()
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w") as cf:
+            json.dump(checkpoint, cf)
+        os.replace(tmp, path)
+
+    def analyze_cameras(self, session_id, inputs, sources, output_path):
+        """
+        Analyzes the three raw camera inputs in parallel worker processes, then projects every
+        detection to where the stitch puts it and merges duplicates from overlapping cameras.
+        Writes the same event log analyze_video would for the stitched output.
+        """
+        self.load_model() # Exports / caches the backend once, before the workers load it
+        self.status = "analyzing"
+        self.current_file = f"{session_id} (cameras)"
+        logger.info(f"Starting per-camera Analysis on {session_id}...")
+
+        manifests = {role: stitcher_service.manifest_for(path) for role, path in sources.items()}
+        offsets = stitcher_service.sync_offsets(session_id, manifests)
+        start_frames = [round(o * (manifests[r].get("fps") or 30)) for r, o in zip(ROLES, offsets)]
+        paths = [os.path.join(settings.EVENTS_DIR, f"{session_id}_{role}_detections.jsonl") for role in ROLES]
+        versions = [f"{model_backends.version}|{self.mode}|{SKIP_FRAMES}|{start}" for start in start_frames]
+
+        workers = max(1, min(len(ROLES), settings.ML_CAMERA_WORKERS))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn: the parent has live threads, which fork would copy in whatever state they're in
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(analyze_camera, self.model_path, cam_input, start, path, threads, version)
+                       for cam_input, start, path, version in zip(inputs, start_frames, paths, versions)]
+            results = []
+            for future in futures:
+                results.append(future.result())
+                self.progress = int(len(results) / len(futures) * 90)
+
+        (native_size, cam_fps) = results[ROLES.index("CAM_C")]
+        fps_video = manifests["CAM_C"].get("fps") or cam_fps or 30
+        matrices, _ = stitcher_service.projections(session_id, sources, manifests, native_size)
+
+        per_camera = []
+        for path in paths:
+            with open(path, "r") as f:
+                rows = (json.loads(line) for line in f if line.strip())
+                per_camera.append({r["frame"]: np.array(r["boxes"], dtype=np.float32).reshape(-1, 6) for r in rows})
+        # Like the stitch, the output ends with the shortest camera
+        frames = sorted(set.intersection(*(set(d) for d in per_camera)))
+
+        partial = output_path + ".partial"
+        with open(partial, "w") as f:
+            lines = []
+            for frame_idx in frames:
+                parts = [(project_boxes(d[frame_idx], m), (0, 0)) for d, m in zip(per_camera, matrices)]
+                detections = merge_detections(parts, settings.ML_MERGE_OVERLAP)
+                lines.append(json.dumps({"timestamp": frame_idx / fps_video, "frame": frame_idx,
+                                         **summarize_detections(detections)}))
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(partial, output_path)
+        for path in paths:
+            os.remove(path)
+            os.remove(path + ".ckpt")
+
+        logger.info(f"Analysis Complete: {output_path} ({len(frames)} frames from 3 cameras)")
+        self.status = "idle"
+        self.current_file = None
+        self.progress = 0
+
+    def scan(self, cap, on_batch, skip_frames=SKIP_FRAMES, start_frame=0, resume_from=0, seekable=True):
+        """
+        Decodes `cap` and hands sampled (frame_idx, frame) pairs to `on_batch`, batch_size
+        at a time. Frames before `start_frame` are skipped and indices count from it.
+        `resume_from` (a sampled index) skips frames already analyzed: by seeking if `cap` is
+        `seekable`, otherwise by grabbing forward.
+        """
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        # Analyze every 10th frame (3fps effective analysis)
-        skip_frames = 10 
+        # Decode runs ahead on its own thread; the queue bound (in frames of this video's size) is the backpressure
+        frame_bytes = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * 3) or 1
+        frames = Queue(maxsize=max(1, min(64, settings.ML_PREFETCH_BYTES // frame_bytes)))
+        stop = threading.Event()
+        decoder = threading.Thread(target=self.decode_frames, args=(cap, skip_frames, frames, stop, start_frame + resume_from, start_frame, seekable),
+                                   name="ml-decode", daemon=True)
+        decoder.start()
         
         start_time = time.time()
+        self.last_ball = None
+        self.sampled = 0
         
-        with open(output_path, "w") as f:
-            frame_idx = 0
+        try:
             processed_count = 0
+            batch = [] # (frame_idx, frame) waiting for the next forward pass
             
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret: break
+            while True:
+                item = frames.get()
+                if item is None: break
+                if isinstance(item, Exception): raise item
+                batch.append(item)
                 
-                if frame_idx % skip_frames == 0:
-                    # Run Inference
-                    results = self.model(frame, classes=[0, 32], verbose=False)
-                    
-                    frame_detections = {
-                        "timestamp": frame_idx / fps_video,
-                        "frame": frame_idx,
-                        "players": 0,
-                        "ball_detected": False
-                    }
-                    
-                    for r in results:
-                        for box in r.boxes:
-                            cls = int(box.cls[0])
-                            if cls == 0: frame_detections["players"] += 1
-                            elif cls == 32: frame_detections["ball_detected"] = True
-                            
-                    # Write to log
-                    f.write(json.dumps(frame_detections) + "\n")
-                    
-                    # Update Status
-                    self.stats = {
-                        "players": frame_detections["players"], 
-                        "ball": frame_detections["ball_detected"]
-                    }
-                    
-                    processed_count += 1
-                    
+                if len(batch) >= self.batch_size:
+                    processed_count += on_batch(batch)
+                    self.progress = int((batch[-1][0] / total_frames) * 100) if total_frames else 0
+                    batch = []
                     # Calc status metrics
                     elapsed = time.time() - start_time
                     if elapsed > 1.0:
                         self.fps_processing = round(processed_count / elapsed, 1)
-                
-                self.progress = int((frame_idx / total_frames) * 100)
-                frame_idx += 1
-                
-        cap.release()
-        logger.info(f"Analysis Complete: {output_path}")
-        self.status = "idle"
-        self.current_file = None
-        self.progress = 0
+            
+            if batch:
+                on_batch(batch)
+        finally:
+            stop.set()
+            while not frames.empty(): # Unblock the decoder if we bailed out early
+                frames.get_nowait()
+            decoder.join()
+            cap.release()
+
+    def open_capture(self, video_path):
+        if settings.ML_DECODE_THREADS:
+            return cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, settings.ML_DECODE_THREADS])
+        return cv2.VideoCapture(video_path)
+
+    def decode_frames(self, cap, skip_frames, frames, stop, first_frame=0, start_frame=0, seekable=True):
+        """
+        Decode thread: queues only the frames that will be analyzed, blocking while the queue is full.
+        Reading begins at `first_frame`; sampling and indices are relative to `start_frame`.
+        """
+        frame_idx = 0
+        try:
+            if first_frame > start_frame:
+                frame_idx = self.skip_to(cap, first_frame, seekable)
+            for frame_idx, frame in sampled_frames(cap, skip_frames, start_frame, frame_idx):
+                if stop.is_set(): break
+                put(frames, (frame_idx - start_frame, frame), stop)
+        except Exception as e:
+            logger.error(f"Decode failed after frame {frame_idx}: {e}")
+            put(frames, e, stop) # Surfaces in analyze_video so the job fails instead of finishing short
+        finally:
+            put(frames, None, stop)
+
+    def skip_to(self, cap, first_frame, seekable):
+        """
+        Positions `cap` on `first_frame` and returns it. A seek is only trusted if it reports
+        landing exactly there; otherwise (and for unseekable inputs) frames are grab()bed
+        forward from the start, so indices can't drift from the frames they label.
+        """
+        if seekable and cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame) and \
+                int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == first_frame:
+            return first_frame
+        if seekable:
+            logger.warning(f"Seek to frame {first_frame} missed; reading forward instead")
+            if not cap.set(cv2.CAP_PROP_POS_FRAMES, 0) or int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != 0:
+                raise ValueError(f"Cannot rewind to resume at frame {first_frame}")
+        frame_idx = 0
+        while frame_idx < first_frame and cap.grab():
+            frame_idx += 1
+        return frame_idx
+
+    def infer(self, images):
+        """Forward passes over `images`, batch_size at a time. Returns one Boxes.data array per image."""
+        out = []
+        for i in range(0, len(images), self.batch_size):
+            results = self.model(images[i:i + self.batch_size], imgsz=settings.ML_IMGSZ,
+                                 classes=[PERSON, BALL], verbose=False)
+            out += [r.boxes.data.cpu().numpy() for r in results]
+        return out
+
+    def tiles(self, frame):
+        h, w = frame.shape[:2]
+        size, overlap = settings.ML_TILE_SIZE, settings.ML_TILE_OVERLAP
+        return [(frame[y:y + size, x:x + size], (x, y))
+                for y in tile_origins(h, size, overlap) for x in tile_origins(w, size, overlap)]
+
+    def detect(self, frames):
+        """
+        Detections per frame (frame coordinates). Every frame gets a whole-frame pass, which is
+        enough for players; tiled and roi modes add native-resolution crops so the ball isn't
+        shrunk to a pixel or two. All crops of a batch go through the model together.
+        """
+        if self.mode not in ("tiled", "roi"):
+            return self.infer(frames)
+
+        # Pass 1: whole frames, plus every tile on keyframes
+        keyframes = []
+        for _ in frames:
+            keyframes.append(self.mode == "tiled" or self.sampled % settings.ML_ROI_KEYFRAME_INTERVAL == 0)
+            self.sampled += 1
+        crops = [] # (frame index in batch, crop, origin)
+        for i, (frame, key) in enumerate(zip(frames, keyframes)):
+            crops.append((i, frame, (0, 0)))
+            if key:
+                crops += [(i, tile, origin) for tile, origin in self.tiles(frame)]
+        parts = [[] for _ in frames]
+        for (i, _, origin), data in zip(crops, self.infer([c for _, c, _ in crops])):
+            parts[i].append((data, origin))
+
+        # Pass 2 (roi): one tile per intermediate frame, centred on its own coarse ball detection
+        # if the whole-frame pass found one, else on the last known ball
+        rois = []
+        for i, key in enumerate(keyframes):
+            merged = merge_detections(parts[i], settings.ML_MERGE_OVERLAP)
+            ball = self.ball_center(merged)
+            if not key and (ball or self.last_ball):
+                rois.append((i, *crop_around(frames[i], ball or self.last_ball, settings.ML_TILE_SIZE)))
+            self.last_ball = ball or self.last_ball
+        for (i, _, origin), data in zip(rois, self.infer([c for _, c, _ in rois])):
+            parts[i].append((data, origin))
+
+        detections = [merge_detections(p, settings.ML_MERGE_OVERLAP) for p in parts]
+        self.last_ball = self.ball_center(detections[-1]) or self.last_ball
+        return detections
+
+    def ball_center(self, data):
+        balls = data[data[:, 5] == BALL]
+        if not len(balls):
+            return None
+        x1, y1, x2, y2 = balls[balls[:, 4].argmax(), :4].tolist()
+        return ((x1 + x2) / 2, (y1 + y2) / 2)
+
+    def infer_batch(self, batch):
+        """One detection pass over a batch of sampled (frame_idx, frame) pairs, timed for the status."""
+        start = time.time()
+        detections = self.detect([frame for _, frame in batch])
+        latency = time.time() - start
+        self.batch_latency_ms = round(latency * 1000, 1)
+        self.inference_fps = round(len(batch) / max(latency, 1e-6), 1)
+        return detections
+
+    def run_batch(self, batch, fps_video, f):
+        """Detects a batch of sampled frames and writes their summaries in frame order."""
+        detections = self.infer_batch(batch)
+        
+        # One detection array per frame, in input order
+        lines = []
+        for (frame_idx, _), data in zip(batch, detections):
+            frame_detections = {
+                "timestamp": frame_idx / fps_video,
+                "frame": frame_idx,
+                **summarize_detections(data)
+            }
+            lines.append(json.dumps(frame_detections))
+        
+        # Write to log
+        f.write("\n".join(lines) + "\n")
+        
+        # Update Status
+        self.stats = {
+            "players": frame_detections["players"], 
+            "ball": frame_detections["ball_detected"]
+        }
+        return len(batch)
 
     def running_loop(self):
         logger.info("Starting ML Loop...")
         while True:
             try:
-                self.scan_and_process()
+                seen = job_store.generation("ml")
+                job = job_store.claim("ml")
+                if job:
+                    self.process_job(job)
+                    continue
+                job_store.wait("ml", seen, timeout=settings.FALLBACK_SCAN_INTERVAL)
             except Exception as e:
                 logger.error(f"ML Loop error: {e}")
-            time.sleep(5)
+                time.sleep(5)
 
 ml_service = MLService()
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+import cv2
+import numpy as np
+from ..config import settings
+from .encoders import encoder_probe
+from . import ladder
+from .common import ROLES, put
+
+logger = logging.getLogger("Panorama")
+
+REFERENCE = "CAM_C" # Outer cameras are warped onto the center camera's image plane
+FEATURE_WIDTH = 1280 # Calibration frames are matched at this width
+
+class CalibrationError(Exception):
+    pass
+
+class PanoramaMaps:
+    """
+    Remap tables and blend weights for one calibration at one output size.
+    Built once, then shared read-only by every render thread.
+    """
+    def __init__(self, out_size, decode_size, rois, maps, weights):
+        self.out_size = out_size # (w, h) of the panorama
+        self.decode_size = decode_size # (w, h) each camera is decoded at
+        self.rois = rois # [(x0, y0, x1, y1)] part of the panorama each camera covers
+        self.maps = maps # [(map1, map2)] per role over its roi, fixed-point (CV_16SC2) for fast remap
+        self.weights = weights # [float32 HxW] per role, feathered towards each camera's edges
+        self.weights_lc = weights[0] + weights[1]
+
+    def render(self, frames):
+        """Warps the three decoded frames into the panorama and feather-blends the overlaps."""
+        w, h = self.out_size
+        left, center, right = warped = [np.empty((h, w, 3), np.uint8) for _ in frames]
+        # Only each camera's own roi is remapped; outside it its weight is 0, so the rest is never read
+        for canvas, frame, (m1, m2), (x0, y0, x1, y1) in zip(warped, frames, self.maps, self.rois):
+            canvas[y0:y1, x0:x1] = cv2.remap(frame, m1, m2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        # blendLinear normalises by the weight sum, so blending pairwise is exact
+        left_center = cv2.blendLinear(left, center, self.weights[0], self.weights[1])
+        return cv2.blendLinear(left_center, right, self.weights_lc, self.weights[2])
+
+    def save(self, path):
+        arrays = {"out_size": np.array(self.out_size), "decode_size": np.array(self.decode_size),
+                  "rois": np.array(self.rois)}
+        for i, ((m1, m2), w) in enumerate(zip(self.maps, self.weights)):
+            arrays[f"map1_{i}"], arrays[f"map2_{i}"], arrays[f"weight_{i}"] = m1, m2, w
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz" # Never shared between writers
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        maps = [(data[f"map1_{i}"], data[f"map2_{i}"]) for i in range(len(ROLES))]
+        weights = [data[f"weight_{i}"] for i in range(len(ROLES))]
+        rois = [tuple(roi) for roi in data["rois"].tolist()]
+        return cls(tuple(data["out_size"].tolist()), tuple(data["decode_size"].tolist()), rois, maps, weights)
+
+class PanoramaService:
+    """
+    Calibrated panorama stitching.
+    Homographies are estimated once per rig setup (cameras + resolution, from the manifests)
+    from snapshot frames of a recording and persisted. Remap tables and blend masks are
+    derived once per calibration and output size and cached on disk; every frame then
+    costs three cv2.remap calls and two blends, spread over a thread pool (both release the GIL).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calibrations = self.load_calibrations()
+        self.maps = {} # { "<calibration hash>_<width>": PanoramaMaps }
+        self.maps_lock = threading.Lock() # One build per table set, even with several workers stitching
+        self.last_fps = None
+
+    def get_status(self):
+        return {
+            "mode": settings.STITCH_MODE,
+            "calibrations": len(self.calibrations),
+            "last_fps": self.last_fps
+        }
+
+    def load_calibrations(self):
+        if not os.path.exists(settings.CALIBRATION_PATH):
+            return {}
+        try:
+            with open(settings.CALIBRATION_PATH, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Could not read calibrations: {e}")
+            return {}
+
+    def save_calibrations(self):
+        os.makedirs(os.path.dirname(settings.CALIBRATION_PATH), exist_ok=True)
+        tmp = settings.CALIBRATION_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.calibrations, f, indent=2)
+        os.replace(tmp, settings.CALIBRATION_PATH)
+
+    def forget(self, rig_key=None):
+        """Drops one (or every) calibration, e.g. after the rig was re-aimed."""
+        with self.lock:
+            if rig_key:
+                self.calibrations.pop(rig_key, None)
+            else:
+                self.calibrations.clear()
+            self.save_calibrations()
+
+    def rig_key(self, manifests):
+        return "|".join(
+            f"{role}={manifests[role].get('camera_id', '?')}@{manifests[role].get('resolution', '?')}"
+            for role in ROLES
+        )
+
+    def snapshot(self, video_path):
+        """One frame from CALIBRATION_SNAPSHOT_TIME into the recording (or the first one if it's shorter)."""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            cap.set(cv2.CAP_PROP_POS_MSEC, settings.CALIBRATION_SNAPSHOT_TIME * 1000)
+            ok, frame = cap.read()
+            if not ok:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = cap.read()
+            if not ok:
+                raise CalibrationError(f"Could not read a frame from {video_path}")
+            return frame, cap.get(cv2.CAP_PROP_FPS) or 30.0
+        finally:
+            cap.release()
+
+    def estimate_homography(self, src, dst):
+        """Homography taking src pixels onto dst pixels (native resolution), from ORB matches."""
+        fs, fd = FEATURE_WIDTH / src.shape[1], FEATURE_WIDTH / dst.shape[1]
+        gray_src = cv2.cvtColor(cv2.resize(src, None, fx=fs, fy=fs, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray_dst = cv2.cvtColor(cv2.resize(dst, None, fx=fd, fy=fd, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+        orb = cv2.ORB_create(4000)
+        kp_src, des_src = orb.detectAndCompute(gray_src, None)
+        kp_dst, des_dst = orb.detectAndCompute(gray_dst, None)
+        if des_src is None or des_dst is None:
+            raise CalibrationError("No features found")
+
+        matches = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(des_src, des_dst, k=2)
+        good = [m[0] for m in matches if len(m) == 2 and m[0].distance < 0.75 * m[1].distance]
+        if len(good) < settings.CALIBRATION_MIN_INLIERS:
+            raise CalibrationError(f"Only {len(good)} feature matches")
+
+        pts_src = np.float32([kp_src[m.queryIdx].pt for m in good])
+        pts_dst = np.float32([kp_dst[m.trainIdx].pt for m in good])
+        H, inlier_mask = cv2.findHomography(pts_src, pts_dst, cv2.RANSAC, 4.0)
+        inliers = int(inlier_mask.sum()) if inlier_mask is not None else 0
+        if H is None or inliers < settings.CALIBRATION_MIN_INLIERS:
+            raise CalibrationError(f"Only {inliers} RANSAC inliers")
+
+        # Back from feature scale to native pixels
+        H = np.diag([1 / fd, 1 / fd, 1]) @ H @ np.diag([fs, fs, 1])
+        return H / H[2, 2], inliers
+
+    def calibrate(self, session_id, sources, manifests):
+        frames, fps = {}, 30.0
+        for role in ROLES:
+            frames[role], fps = self.snapshot(sources[role])
+        h, w = frames[REFERENCE].shape[:2]
+
+        homographies, inliers = {REFERENCE: np.eye(3).tolist()}, {}
+        for role in ROLES:
+            if role != REFERENCE:
+                H, count = self.estimate_homography(frames[role], frames[REFERENCE])
+                homographies[role], inliers[role] = H.tolist(), count
+
+        key_material = json.dumps(homographies) + f"{w}x{h}"
+        return {
+            "homographies": homographies,
+            "native_size": [w, h],
+            "fps": manifests[REFERENCE].get("fps") or fps,
+            "inliers": inliers,
+            "session_id": session_id,
+            "hash": hashlib.sha1(key_material.encode()).hexdigest()[:12],
+            "created_at": time.time()
+        }
+
+    def get_calibration(self, session_id, sources, manifests):
+        key = self.rig_key(manifests)
+        with self.lock:
+            if key not in self.calibrations:
+                logger.info(f"Calibrating rig setup {key} from {session_id}...")
+                calibration = self.calibrate(session_id, sources, manifests)
+                self.calibrations[key] = calibration
+                self.save_calibrations()
+                logger.info(f"Calibrated ({calibration['inliers']} inliers)")
+            return self.calibrations[key]
+
+    def canvas(self, calibration, out_width):
+        """Panorama size and the transform from the reference camera's plane onto it."""
+        native_w, native_h = calibration["native_size"]
+        homographies = [np.array(calibration["homographies"][role]) for role in ROLES]
+
+        # Panorama bounds in the reference plane
+        corners = np.float32([[0, 0], [native_w, 0], [native_w, native_h], [0, native_h]]).reshape(-1, 1, 2)
+        warped = np.concatenate([cv2.perspectiveTransform(corners, H) for H in homographies])
+        (min_x, min_y), (max_x, max_y) = warped.min(axis=(0, 1)), warped.max(axis=(0, 1))
+        scale = out_width / (max_x - min_x)
+        out_w, out_h = ladder.even(out_width), ladder.even((max_y - min_y) * scale)
+        if out_h > out_w:
+            raise CalibrationError(f"Degenerate calibration ({out_w}x{out_h} panorama)")
+        to_canvas = np.array([[scale, 0, -min_x * scale], [0, scale, -min_y * scale], [0, 0, 1]])
+        return (out_w, out_h), scale, to_canvas
+
+    def projections(self, calibration, out_width):
+        """Per role (L/C/R order), the homography from native camera pixels to panorama pixels."""
+        _, _, to_canvas = self.canvas(calibration, out_width)
+        return [to_canvas @ np.array(calibration["homographies"][role]) for role in ROLES]
+
+    def build_maps(self, calibration, out_width):
+        native_w, native_h = calibration["native_size"]
+        homographies = [np.array(calibration["homographies"][role]) for role in ROLES]
+        (out_w, out_h), scale, to_canvas = self.canvas(calibration, out_width)
+
+        # Decode each camera at roughly the panorama's scale, so remap neither wastes nor invents pixels
+        decode_w = min(native_w, ladder.even(native_w * scale))
+        decode_h = ladder.even(native_h * decode_w / native_w)
+        to_decode = np.diag([decode_w / native_w, decode_h / native_h, 1])
+
+        xs, ys = np.meshgrid(np.arange(out_w, dtype=np.float32), np.arange(out_h, dtype=np.float32))
+        rois, maps, weights = [], [], []
+        for H in homographies:
+            # Inverse mapping: panorama pixel -> decoded source pixel
+            A = (to_decode @ np.linalg.inv(to_canvas @ H)).astype(np.float32)
+            den = A[2, 0] * xs + A[2, 1] * ys + A[2, 2]
+            valid = den > 1e-6
+            den = np.where(valid, den, 1)
+            map_x = (A[0, 0] * xs + A[0, 1] * ys + A[0, 2]) / den
+            map_y = (A[1, 0] * xs + A[1, 1] * ys + A[1, 2]) / den
+            valid &= (map_x >= 0) & (map_x <= decode_w - 1) & (map_y >= 0) & (map_y <= decode_h - 1)
+
+            # Feather: weight ramps up over PANORAMA_FEATHER px from the camera's own edges
+            edge = np.minimum.reduce([map_x, decode_w - 1 - map_x, map_y, decode_h - 1 - map_y])
+            weight = np.clip(edge / settings.PANORAMA_FEATHER, 1e-3, 1).astype(np.float32)
+            weights.append(np.where(valid, weight, 0).astype(np.float32))
+
+            map_x[~valid], map_y[~valid] = -1, -1
+            rows, cols = np.flatnonzero(valid.any(axis=1)), np.flatnonzero(valid.any(axis=0))
+            if not len(rows):
+                raise CalibrationError("A camera falls outside the panorama")
+            x0, y0, x1, y1 = int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+            rois.append((x0, y0, x1, y1))
+            maps.append(cv2.convertMaps(map_x[y0:y1, x0:x1], map_y[y0:y1, x0:x1], cv2.CV_16SC2))
+        return PanoramaMaps((out_w, out_h), (decode_w, decode_h), rois, maps, weights)
+
+    def get_maps(self, calibration, out_width):
+        cache_key = f"{calibration['hash']}_{out_width}"
+        with self.maps_lock:
+            if cache_key in self.maps:
+                return self.maps[cache_key]
+            path = os.path.join(settings.CALIBRATION_CACHE_DIR, f"{cache_key}.npz")
+            if os.path.exists(path):
+                maps = PanoramaMaps.load(path)
+            else:
+                logger.info(f"Precomputing remap tables for {cache_key}...")
+                maps = self.build_maps(calibration, out_width)
+                os.makedirs(settings.CALIBRATION_CACHE_DIR, exist_ok=True)
+                maps.save(path)
+            self.maps[cache_key] = maps
+            return maps
+
+    def read_frames(self, cam_input, offset, size, threads, queue, stop):
+        """
+        Decoder thread: raw BGR frames at the decode size into a bounded queue; None marks the end.
+        If ffmpeg exits with an error (corrupt / unreadable input), the end marker is that error instead.
+        """
+        w, h = size
+        decoder_args, input_filter = encoder_probe.decode_options(w, h)
+        seek = ["-ss", f"{offset:.3f}"] if offset else []
+        cmd = ["ffmpeg", "-v", "error", *seek, *decoder_args, "-threads", str(threads), "-i", cam_input,
+               "-an", "-vf", input_filter, "-pix_fmt", "bgr24", "-f", "rawvideo", "-"]
+        frame_bytes = w * h * 3
+        errors = tempfile.TemporaryFile() # A file, not a pipe, so a chatty decoder can't block on it
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors, bufsize=frame_bytes)
+        end = None
+        try:
+            while not stop.is_set():
+                buf = proc.stdout.read(frame_bytes)
+                if len(buf) < frame_bytes:
+                    if proc.wait() != 0:
+                        errors.seek(0)
+                        stderr = errors.read().decode(errors="replace").strip()
+                        logger.error(f"Decoding {cam_input} failed ({proc.returncode}): {stderr[-1000:]}")
+                        end = subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+                    break
+                put(queue, np.frombuffer(buf, np.uint8).reshape(h, w, 3), stop)
+        finally:
+            put(queue, end, stop)
+            proc.kill()
+            proc.wait()
+            errors.close()
+
+    def encoder_command(self, size, fps, threads, out_path, hls_dir=None):
+        encoder = encoder_probe.encoder_spec()
+        rungs = ladder.ladder_rungs(size[1]) if hls_dir else []
+        cmd = ["ffmpeg", "-y", *encoder.get("global", []),
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-"]
+        # Without a hardware upload filter, convert to 4:2:0 so browsers can play it
+        graph = ladder.split_outputs("[0:v]format=yuv420p", encoder.get("filter"), rungs)
+        cmd += ["-filter_complex", graph, "-map", "[v]", *encoder["args"], "-threads", str(threads), "-g", "30"]
+        if rungs:
+            cmd += ladder.KEYFRAME_ARGS
+        cmd += ["-movflags", "+faststart", out_path]
+        cmd += ladder.hls_output_args(rungs, encoder["args"], threads, hls_dir, encoder["codec"])
+        return cmd
+
+    def stitch(self, session_id, sources, manifests, inputs, offsets, out_path, threads, hls_dir=None):
+        """
+        Stitches one session into a calibrated panorama.
+        `sources` are plain files per role for calibration snapshots, `inputs` the ffmpeg inputs,
+        `offsets` the per-input sync trims in seconds, `hls_dir` where ladder rungs go (if any).
+        Returns the panorama size, or None when the rig can't be calibrated so the caller
+        can fall back to hstack.
+        """
+        try:
+            calibration = self.get_calibration(session_id, sources, manifests)
+            maps = self.get_maps(calibration, settings.PANORAMA_WIDTH)
+        except CalibrationError as e:
+            logger.warning(f"No panorama calibration for {session_id}: {e}")
+            return None
+
+        stop = threading.Event()
+        queues = [Queue(maxsize=settings.PANORAMA_QUEUE_FRAMES) for _ in inputs]
+        decode_threads = max(1, threads // len(inputs))
+        readers = [
+            threading.Thread(target=self.read_frames,
+                             args=(cam_input, offset, maps.decode_size, decode_threads, q, stop),
+                             name=f"{threading.current_thread().name}-decode-{i}", daemon=True)
+            for i, (cam_input, offset, q) in enumerate(zip(inputs, offsets, queues))
+        ]
+        for reader in readers:
+            reader.start()
+
+        encoder = subprocess.Popen(self.encoder_command(maps.out_size, calibration["fps"], threads, out_path, hls_dir),
+                                   stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        logger.info(f"Panorama {session_id}: {maps.out_size[0]}x{maps.out_size[1]} from "
+                    f"{maps.decode_size[0]}x{maps.decode_size[1]} inputs, {threads} render threads")
+
+        # Frames render out of order on the pool; writing futures FIFO keeps output order
+        start, written = time.time(), 0
+        pending = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="panorama") as pool:
+                while True:
+                    frames = [q.get() for q in queues]
+                    for frame in frames:
+                        if isinstance(frame, Exception):
+                            raise frame # A camera failed to decode; the panorama would end short
+                    if any(frame is None for frame in frames):
+                        break
+                    pending.append(pool.submit(maps.render, frames))
+                    if len(pending) >= threads * 2:
+                        encoder.stdin.write(pending.popleft().result())
+                        written += 1
+                while pending:
+                    encoder.stdin.write(pending.popleft().result())
+                    written += 1
+        except BrokenPipeError:
+            pass # Encoder died; its exit code says why
+        except Exception:
+            encoder.kill()
+            raise
+        finally:
+            stop.set()
+            for q in queues: # Unblock readers waiting on a full queue
+                while not q.empty():
+                    q.get_nowait()
+            for reader in readers:
+                reader.join()
+            try:
+                encoder.stdin.close()
+            except OSError:
+                pass
+
+        if encoder.wait() != 0:
+            raise subprocess.CalledProcessError(encoder.returncode, encoder.args)
+        self.last_fps = round(written / max(time.time() - start, 1e-3), 1)
+        logger.info(f"Panorama {session_id}: {written} frames at {self.last_fps} fps")
+        return maps.out_size
+
+panorama_service = PanoramaService()
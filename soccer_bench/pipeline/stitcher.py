@@ -1,143 +1,509 @@
 import os
+import re
+import json
 import time
 import subprocess
 import logging
+import threading
+import numpy as np
 from ..config import settings
+from ..jobs import job_store
+from ..events import event_bus
+from .encoders import encoder_probe
+from .panorama import panorama_service, CalibrationError
+from . import ladder
+from .common import ROLES
 
 logger = logging.getLogger("Stitcher")
 
+KEYFRAME_SEARCH_SECONDS = 10 # How far past a slice point to look for its keyframe (GOPs are ~1s)
+
+# Segment files from rigs in segmented mode: {session}_{cam}_{timestamp}_seg0003.mp4
+SEGMENT_RE = re.compile(r"_seg(\d+)\.mp4$")
+
 class StitchingService:
     def __init__(self):
-        self.queue = [] # List of session_ids
-        self.active_job = None
-        self.processed_sessions = set()
+        self.active_jobs = {} # { session_id: worker name }
+        # In-memory index of raw files: { session_id: { "CAM_L": {files}, ... } }
+        self.sessions = {}
+        self.lock = threading.Lock()
+        event_bus.subscribe("file_ingested", self.on_file)
+        event_bus.subscribe("file_dropped", self.on_file)
         
     def get_status(self):
+        active = list(self.active_jobs)
         return {
-            "queue_length": len(self.queue),
-            "active_job": self.active_job
+            "queue_length": job_store.count("stitch", "pending"),
+            "active_job": active[0] if active else None,
+            "active_jobs": active,
+            "workers": self.worker_count(),
+            "threads_per_job": self.threads_per_job(),
+            "encoder": encoder_probe.get_status(),
+            "panorama": panorama_service.get_status()
         }
 
+    def worker_count(self):
+        return max(1, settings.STITCH_WORKERS)
+
+    def threads_per_job(self):
+        """Splits the cores between concurrent ffmpeg processes so they don't oversubscribe."""
+        if settings.STITCH_THREADS_PER_JOB:
+            return settings.STITCH_THREADS_PER_JOB
+        return max(1, (os.cpu_count() or 1) // self.worker_count())
+
     def ensure_dir(self, path):
         if not os.path.exists(path):
             os.makedirs(path)
 
-    def scan_for_sessions(self):
+    def index_file(self, f):
         """
-        Scans raw storage for complete sets of videos (L, C, R).
+        Adds a raw video to the session index. Returns its session_id, or None if it isn't one.
         Example naming: {session_id}_{cam_id}_{timestamp}.mp4
-        We need to group by session_id.
+        """
+        if not f.endswith(".mp4"):
+            return None
+        parts = f.split("_")
+        if len(parts) < 3: return None
+        
+        # parts[0] is usually session_id if we follow naming convention
+        # But the spec said {SESSION_ID}_{CAM_ID}...
+        # Let's assume session_id doesn't have underscores for safety, 
+        # or we rely on the CAM_ID tag to split.
+        
+        # Robust split: find CAM_L, CAM_C, CAM_R index
+        cam_role = None
+        if "CAM_L" in f: cam_role = "CAM_L"
+        elif "CAM_C" in f: cam_role = "CAM_C"
+        elif "CAM_R" in f: cam_role = "CAM_R"
+        
+        if not cam_role: return None
+        
+        # Session ID is everything before the cam_role
+        session_id = f.split(f"_{cam_role}")[0]
+        
+        # Segmented recordings contribute several files per camera
+        with self.lock:
+            self.sessions.setdefault(session_id, {}).setdefault(cam_role, set()).add(f)
+        return session_id
+
+    def session_files(self, session_id):
+        """{role: [files]} for a session, minus files that have left raw storage since they were indexed."""
+        raw_dir = settings.RAW_STORAGE_DIR
+        with self.lock:
+            # e.g. renamed to .bad after a checksum mismatch
+            for files in self.sessions.get(session_id, {}).values():
+                files.difference_update({f for f in files if not os.path.exists(os.path.join(raw_dir, f))})
+            return {r: list(files) for r, files in self.sessions.get(session_id, {}).items()}
+
+    def check_session(self, sid):
+        """Queues a stitch job once all three cameras of a session are present."""
+        if job_store.get(sid, "stitch"): return
+        
+        roles = self.session_files(sid)
+        if all(r in roles and self.role_complete(sid, r, roles[r]) for r in ROLES):
+            # Output from before the job store existed: adopt it instead of re-stitching
+            out_file = os.path.join(settings.PROCESSED_STORAGE_DIR, f"{sid}_stitched.mp4")
+            if os.path.exists(out_file):
+                self.adopt_existing(sid, out_file)
+                return
+                
+            logger.info(f"Found complete session: {sid}. Queuing for stitch.")
+            job_store.enqueue(sid, "stitch")
+            if settings.ML_SOURCE == "cameras":
+                job_store.enqueue(sid, "ml") # Runs on the raw inputs alongside stitching
+
+    def on_file(self, path, **_):
+        """Ingest hand-off (and watcher fallback for files copied in by hand)."""
+        directory, name = os.path.split(path)
+        if os.path.abspath(directory) == os.path.abspath(settings.RAW_STORAGE_DIR):
+            sid = self.index_file(name)
+            if sid:
+                # A replaced camera file (e.g. re-downloaded after a bad checksum) deserves another go
+                if (job_store.get(sid, "stitch") or {}).get("status") == "failed":
+                    job_store.retry_failed(sid)
+                self.check_session(sid)
+        elif os.path.abspath(directory) == os.path.abspath(settings.PROCESSED_STORAGE_DIR) and name.endswith("_stitched.mp4"):
+            sid = name[:-len("_stitched.mp4")]
+            if not job_store.get(sid, "stitch"):
+                self.adopt_existing(sid, path)
+
+    def scan_for_sessions(self):
+        """
+        Full rescan of raw storage for complete sets of videos (L, C, R).
+        Only needed at startup and as a slow fallback; ingest reports new files through the event bus.
         """
         raw_dir = settings.RAW_STORAGE_DIR
-        processed_dir = settings.PROCESSED_STORAGE_DIR
         if not os.path.exists(raw_dir):
             return
 
-        files = [f for f in os.listdir(raw_dir) if f.endswith(".mp4") and not f.endswith(".bad")]
-        
-        # Group by Session ID
-        # Filename: session123_CAM_L_2023...mp4
-        sessions = {}
-        for f in files:
-            parts = f.split("_")
-            if len(parts) < 3: continue
-            
-            # parts[0] is usually session_id if we follow naming convention
-            # But the spec said {SESSION_ID}_{CAM_ID}...
-            # Let's assume session_id doesn't have underscores for safety, 
-            # or we rely on the CAM_ID tag to split.
-            
-            # Robust split: find CAM_L, CAM_C, CAM_R index
-            cam_role = None
-            if "CAM_L" in f: cam_role = "CAM_L"
-            elif "CAM_C" in f: cam_role = "CAM_C"
-            elif "CAM_R" in f: cam_role = "CAM_R"
-            
-            if not cam_role: continue
-            
-            # Session ID is everything before the cam_role
-            session_id = f.split(f"_{cam_role}")[0]
-            
-            if session_id not in sessions:
-                sessions[session_id] = {}
-            
-            sessions[session_id][cam_role] = f
-
-        # Check for completeness
-        for sid, roles in sessions.items():
-            if sid in self.processed_sessions: continue
-            if sid in self.queue: continue
-            
-            if "CAM_L" in roles and "CAM_C" in roles and "CAM_R" in roles:
-                # Check if output already exists (avoid re-stitching on restart)
-                out_file = os.path.join(processed_dir, f"{sid}_stitched.mp4")
-                if os.path.exists(out_file):
-                    self.processed_sessions.add(sid)
-                    continue
-                    
-                logger.info(f"Found complete session: {sid}. Queuing for stitch.")
-                self.queue.append(sid)
+        sids = set()
+        for f in os.listdir(raw_dir):
+            sid = self.index_file(f)
+            if sid:
+                sids.add(sid)
 
-    def run_stitch_job(self, session_id):
-        self.active_job = session_id
+        for sid in sids:
+            self.check_session(sid)
+
+    def adopt_existing(self, session_id, out_file):
+        """Records legacy outputs so downstream stages pick up where the old pipeline left off."""
+        event_file = os.path.join(settings.EVENTS_DIR, f"{session_id}_stitched_events.jsonl")
+        artifacts = {"stitched": out_file, "events": event_file}
+        if os.path.exists(event_file + ".uploaded"):
+            for stage in ("stitch", "ml", "upload"):
+                job_store.complete(session_id, stage, artifacts)
+        elif os.path.exists(event_file):
+            job_store.complete(session_id, "stitch", artifacts)
+            job_store.complete(session_id, "ml", artifacts, next_stage="upload")
+        else:
+            job_store.complete(session_id, "stitch", artifacts, next_stage="ml")
+
+    def role_complete(self, session_id, cam_role, files):
+        """
+        A monolithic recording is complete once ingested. A segmented one is complete
+        when the manifest flagged 'final' has arrived along with every segment before it.
+        """
+        indexes = [int(m.group(1)) for m in (SEGMENT_RE.search(f) for f in files) if m]
+        if not indexes:
+            return True
         
         raw_dir = settings.RAW_STORAGE_DIR
-        out_dir = settings.PROCESSED_STORAGE_DIR
-        self.ensure_dir(out_dir)
+        prefix = f"{session_id}_{cam_role}_seg"
+        for man_file in os.listdir(raw_dir):
+            if not (man_file.startswith(prefix) and man_file.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(raw_dir, man_file), 'r') as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if data.get("final"):
+                return sorted(indexes) == list(range(data["segment"] + 1))
+        return False
+
+    def camera_input(self, raw_dir, files):
+        """ffmpeg input for one camera; segments are raw H.265 and join with the concat protocol."""
+        files = sorted(files)
+        if len(files) == 1:
+            return os.path.join(raw_dir, files[0])
+        return "concat:" + "|".join(os.path.join(raw_dir, f) for f in files)
+
+    def session_sources(self, session_id):
+        """
+        (inputs, sources) for a session: the ffmpeg input per camera in L/C/R order, and the
+        first (or only) file per role, which start times and calibration snapshots come from.
+        None if a camera's files are missing.
+        """
+        raw_dir = settings.RAW_STORAGE_DIR
+        roles = self.session_files(session_id)
+        if not all(roles.get(r) for r in ROLES):
+            return None
+        inputs = [self.camera_input(raw_dir, roles[r]) for r in ROLES]
+        sources = {r: os.path.join(raw_dir, sorted(roles[r])[0]) for r in ROLES}
+        return inputs, sources
+
+    def manifest_for(self, video_path):
+        """The manifest ingested alongside a raw video (or segment), or {} if there isn't one."""
+        raw_dir, name = os.path.split(video_path)
+        for man_file in os.listdir(raw_dir):
+            if not man_file.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(raw_dir, man_file), 'r') as f:
+                    data = json.load(f)
+            except Exception:
+                continue
+            if data.get("file") == name:
+                return data
+        return {}
+
+    def sync_offsets(self, session_id, manifests):
+        """
+        Per-camera trims (seconds, in L/C/R order) that line every camera up on the one that
+        started last, from the manifests' start_time_master, snapped to whole frames.
+        Applied as input seeks, so alignment needs no separate trim pass.
+        """
+        starts = {}
+        for role in ROLES:
+            m = manifests[role]
+            if m.get("start_time_master") is not None:
+                starts[role] = m["start_time_master"]
+            elif m.get("start_time_local") is not None:
+                starts[role] = m["start_time_local"] - m.get("offset_ms", 0) / 1000.0
+        if len(starts) < len(ROLES):
+            logger.warning(f"{session_id}: manifests lack start times, stitching unaligned")
+            return [0.0] * len(ROLES)
+
+        latest = max(starts.values())
+        offsets = []
+        for role in ROLES:
+            fps = manifests[role].get("fps") or 30
+            offsets.append(round((latest - starts[role]) * fps) / fps)
+            if manifests[role].get("dropped_frames"):
+                # Start alignment can't undo mid-recording drops; they show as drift later on
+                logger.warning(f"{session_id}: {role} dropped {manifests[role]['dropped_frames']} frames")
+        logger.info(f"{session_id}: sync trims " + ", ".join(f"{r}={o:.3f}s" for r, o in zip(ROLES, offsets)))
+        return offsets
+
+    def build_command(self, inputs, out_path, start=None, duration=None, threads=None, faststart=True, width=None,
+                      offsets=None, rungs=None, hls_dir=None):
+        """
+        ffmpeg -i L -i C -i R -filter_complex hstack=inputs=3 output
+        This job's share of the cores is split, not repeated: the encoder (the main cost) and
+        filter graph get about half, and each decoder an equal slice of the rest.
+        `start`/`duration` restrict every input to the same time range (input-side seek).
+        `offsets` are per-input sync trims added to that seek, so alignment costs no extra pass.
+        `width` (default STITCH_OUTPUT_WIDTH) is reached by scaling each input at decode,
+        so the native 3x-wide intermediate is never built.
+        `rungs` adds an HLS output in `hls_dir` with those heights, split off the same decode.
+        The encoder is whatever the host probe picked as fastest.
+        """
+        threads = threads or self.threads_per_job()
+        encode_threads = max(1, (threads + 1) // 2)
+        decode_threads = max(1, (threads - encode_threads) // len(inputs))
+        encode_threads = str(encode_threads)
+        width = width or settings.STITCH_OUTPUT_WIDTH or None
+        input_width = (width // len(inputs)) // 2 * 2 if width else None
+        decoder_args, input_filter = encoder_probe.decode_options(input_width)
+        encoder = encoder_probe.encoder_spec()
+        cmd = ["ffmpeg", "-y", *encoder.get("global", []), "-filter_complex_threads", encode_threads]
+        offsets = offsets or [0.0] * len(inputs)
+        for cam_input, offset in zip(inputs, offsets):
+            seek = (start or 0.0) + offset
+            if start is not None or seek > 0:
+                cmd += ["-ss", f"{seek:.3f}"]
+            if duration is not None:
+                cmd += ["-t", f"{duration:.3f}"]
+            cmd += [*decoder_args, "-threads", str(decode_threads), "-i", cam_input]
+
+        if input_filter:
+            graph = "".join(f"[{i}:v]{input_filter}[in{i}];" for i in range(len(inputs)))
+            graph += "".join(f"[in{i}]" for i in range(len(inputs)))
+        else:
+            graph = "".join(f"[{i}:v]" for i in range(len(inputs)))
+        graph += f"hstack=inputs={len(inputs)}:shortest=1" # Trimmed inputs end at different times
+        # Encoder filter (e.g. hwupload for VAAPI) and the ladder split
+        graph = ladder.split_outputs(graph, encoder.get("filter"), rungs)
+        cmd += [
+            "-filter_complex", graph,
+            "-map", "[v]",
+            *encoder["args"],
+            "-threads", encode_threads,
+            "-g", "30", # Keyframe every 1s (assuming 30fps) for fast seeking
+        ]
+        if rungs:
+            cmd += ladder.KEYFRAME_ARGS # Segment boundaries must match the smaller rungs
+        if faststart:
+            cmd += ["-movflags", "+faststart"] # Move metadata to front for instant web playback
+        cmd.append(out_path)
+        cmd += ladder.hls_output_args(rungs, encoder["args"], encode_threads, hls_dir, encoder["codec"])
+        return cmd
+
+    def probe_size(self, path):
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
+             "-of", "csv=p=0", path],
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+        w, h = out.split(",")[:2]
+        return int(w), int(h)
+
+    def output_size(self, manifests, reference):
+        """Size of the hstack output, from the center camera's manifest (or ffprobe if it has none)."""
+        resolution = manifests["CAM_C"].get("resolution")
+        w, h = map(int, resolution.split("x")) if resolution else self.probe_size(reference)
+        return self.hstack_size(w, h)
+
+    def hstack_size(self, w, h):
+        if settings.STITCH_OUTPUT_WIDTH:
+            input_width = (settings.STITCH_OUTPUT_WIDTH // len(ROLES)) // 2 * 2
+            return input_width * len(ROLES), ladder.even(h * input_width / w)
+        return w * len(ROLES), h
+
+    def projections(self, session_id, sources, manifests, native_size):
+        """
+        Where the stitched output will put each camera's pixels: one 3x3 matrix per role
+        (L/C/R order) from native camera pixels to output pixels, plus the output size.
+        Follows the stitch itself: the calibrated panorama, or hstack when there's none.
+        """
+        if settings.STITCH_MODE == "panorama":
+            try:
+                calibration = panorama_service.get_calibration(session_id, sources, manifests)
+                out_size, _, _ = panorama_service.canvas(calibration, settings.PANORAMA_WIDTH)
+                return panorama_service.projections(calibration, settings.PANORAMA_WIDTH), out_size
+            except CalibrationError as e:
+                logger.warning(f"No panorama calibration for {session_id}, projecting onto hstack: {e}")
+        w, h = native_size
+        out_w, out_h = self.hstack_size(w, h)
+        tile_w = out_w / len(ROLES)
+        return [np.array([[tile_w / w, 0, i * tile_w], [0, out_h / h, 0], [0, 0, 1]])
+                for i in range(len(ROLES))], (out_w, out_h)
+
+    def probe_duration(self, path):
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+        return float(out)
+
+    def keyframe_at_or_after(self, path, t):
+        """
+        First keyframe time >= t, or None if there is none within KEYFRAME_SEARCH_SECONDS.
+        Only keyframes are decoded. -read_intervals starts at the keyframe at or *before* t,
+        so earlier ones are filtered out here.
+        """
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+             "-read_intervals", f"{t:.3f}%+{KEYFRAME_SEARCH_SECONDS}", "-show_entries", "frame=pts_time",
+             "-of", "csv=p=0", path],
+            check=True, capture_output=True, text=True
+        ).stdout.split()
+        after = [float(v) for v in out if v != "N/A" and float(v) >= t - 1e-3]
+        return min(after) if after else None
+
+    def slice_ranges(self, reference, slices, offset=0.0):
+        """
+        Splits the session into `slices` time ranges whose cut points sit on keyframes of the
+        reference (center) camera, so every slice starts with a clean seek.
+        Times are on the reference's own clock, starting at its sync trim `offset`.
+        """
+        duration = self.probe_duration(reference)
+        cuts = [offset]
+        for i in range(1, slices):
+            cut = self.keyframe_at_or_after(reference, offset + (duration - offset) * i / slices)
+            if cut is not None and cuts[-1] < cut < duration:
+                cuts.append(cut)
+        cuts.append(duration)
+        return [(a, b - a) for a, b in zip(cuts, cuts[1:])]
+
+    def run_sliced(self, session_id, inputs, offsets, out_path):
+        """
+        Encodes time slices as parallel ffmpeg processes and joins them with the
+        concat demuxer (-c copy, no re-encode).
+        """
+        slices = self.slice_ranges(inputs[1], settings.STITCH_SLICES, offsets[1])
+        slice_threads = max(1, self.threads_per_job() // len(slices))
+        work_dir = os.path.join(os.path.dirname(out_path), f".{session_id}_slices")
+        self.ensure_dir(work_dir)
+        
+        slice_paths = []
+        procs = []
+        for i, (start, duration) in enumerate(slices):
+            slice_path = os.path.join(work_dir, f"slice_{i:03d}.mp4")
+            slice_paths.append(slice_path)
+            # Slice times are on the center camera's clock; shift onto the aligned timeline
+            cmd = self.build_command(inputs, slice_path, start - offsets[1], duration, slice_threads,
+                                     faststart=False, offsets=offsets)
+            procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        logger.info(f"Stitching {session_id} as {len(procs)} slices x {slice_threads} threads")
         
-        # Find files again (could cache them but safe to look up)
-        # We need exact paths
-        files = [f for f in os.listdir(raw_dir) if f.startswith(session_id) and f.endswith(".mp4")]
+        failed = [p.args for p in procs if p.wait() != 0]
+        if failed:
+            raise subprocess.CalledProcessError(1, failed[0])
         
-        f_left = next((f for f in files if "CAM_L" in f), None)
-        f_center = next((f for f in files if "CAM_C" in f), None)
-        f_right = next((f for f in files if "CAM_R" in f), None)
+        list_path = os.path.join(work_dir, "concat.txt")
+        with open(list_path, "w") as f:
+            for path in slice_paths:
+                f.write(f"file '{path}'\n")
+        subprocess.run(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "+faststart", out_path],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for path in slice_paths + [list_path]:
+            os.remove(path)
+        os.rmdir(work_dir)
+
+    def run_stitch_job(self, session_id):
+        self.active_jobs[session_id] = threading.current_thread().name
         
-        if not (f_left and f_center and f_right):
+        out_dir = settings.PROCESSED_STORAGE_DIR
+        self.ensure_dir(out_dir)
+        
+        session = self.session_sources(session_id)
+        if not session:
             logger.error(f"Job {session_id} failed: Missing files unexpectedly.")
-            self.active_job = None
+            job_store.fail(session_id, "stitch", "missing camera files")
+            self.active_jobs.pop(session_id, None)
             return
 
         out_path = os.path.join(out_dir, f"{session_id}_stitched.mp4")
+        inputs, sources = session
+        # Concatenated raw segments can't be seeked reliably, so those stitch in one pass.
+        # Same with a ladder: the rungs come out of the single decode pass.
+        sliced = settings.STITCH_SLICES > 1 and not settings.STITCH_HLS and \
+            not any(i.startswith("concat:") for i in inputs)
+        hls_dir = os.path.join(settings.HLS_DIR, session_id) if settings.STITCH_HLS else None
         
-        # Build Command
-        # ffmpeg -i L -i C -i R -filter_complex hstack=inputs=3 output
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", os.path.join(raw_dir, f_left),
-            "-i", os.path.join(raw_dir, f_center),
-            "-i", os.path.join(raw_dir, f_right),
-            "-filter_complex", "[0:v][1:v][2:v]hstack=inputs=3[v]",
-            "-map", "[v]",
-            "-c:v", "libx264",
-            "-preset", "ultrafast",
-            "-crf", "23",
-            "-g", "30", # Keyframe every 1s (assuming 30fps) for fast seeking
-            "-movflags", "+faststart", # Move metadata to front for instant web playback
-            out_path
-        ]
+        manifests = {role: self.manifest_for(path) for role, path in sources.items()}
+        offsets = self.sync_offsets(session_id, manifests)
         
         logger.info(f"Stitching {session_id}...")
         try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if hls_dir:
+                ladder.prepare(hls_dir)
+            out_size = None
+            if settings.STITCH_MODE == "panorama":
+                out_size = panorama_service.stitch(session_id, sources, manifests, inputs, offsets, out_path,
+                                                   self.threads_per_job(), hls_dir)
+            if not out_size and sliced:
+                # hstack, also the fallback when the rig can't be calibrated
+                self.run_sliced(session_id, inputs, offsets, out_path)
+            elif not out_size:
+                out_size = self.output_size(manifests, sources["CAM_C"]) if hls_dir else None
+                rungs = ladder.ladder_rungs(out_size[1]) if out_size else []
+                cmd = self.build_command(inputs, out_path, offsets=offsets, rungs=rungs, hls_dir=hls_dir)
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             logger.info(f"Stitching Complete: {out_path}")
-            self.processed_sessions.add(session_id)
+            artifacts = {"stitched": out_path, "sync_offsets": dict(zip(ROLES, offsets))}
+            if hls_dir:
+                artifacts["hls"] = ladder.package(session_id, out_path, hls_dir, out_size,
+                                                  ladder.ladder_rungs(out_size[1]), encoder_probe.encoder_spec()["codec"])
+            if settings.ML_SOURCE == "cameras":
+                # Analysis has been running on the raw inputs; upload waits for both
+                job_store.complete(session_id, "stitch", artifacts, next_stage="upload", requires=["ml"])
+            else:
+                job_store.complete(session_id, "stitch", artifacts, next_stage="ml")
         except subprocess.CalledProcessError as e:
             logger.error(f"Stitching failed for {session_id}: {e}")
+            job_store.fail(session_id, "stitch", e)
+        except (ValueError, IndexError) as e:
+            logger.error(f"Could not probe {session_id} for slicing: {e}")
+            job_store.fail(session_id, "stitch", e)
         except FileNotFoundError:
              logger.error("FFmpeg not found! Is it installed?")
+             job_store.fail(session_id, "stitch", "ffmpeg not found")
         finally:
-            self.active_job = None
+            self.active_jobs.pop(session_id, None)
+
+    def worker_loop(self):
+        while True:
+            job = None
+            try:
+                seen = job_store.generation("stitch")
+                job = job_store.claim("stitch")
+                if job:
+                    self.run_stitch_job(job["session_id"])
+                else:
+                    job_store.wait("stitch", seen, timeout=settings.FALLBACK_SCAN_INTERVAL)
+            except Exception as e:
+                # Unexpected errors mustn't kill the worker or leave the job 'running'
+                logger.error(f"Stitch worker error: {e}")
+                if job:
+                    self.active_jobs.pop(job["session_id"], None)
+                    job_store.fail(job["session_id"], "stitch", e)
+                time.sleep(5)
 
     def running_loop(self):
-        logger.info("Starting Stitching Loop...")
+        logger.info(f"Starting Stitching Loop ({self.worker_count()} workers x {self.threads_per_job()} threads)...")
+        encoder_probe.ensure() # Benchmarks once per host/ffmpeg build, then cached
+        self.scan_for_sessions()
+        for i in range(self.worker_count()):
+            threading.Thread(target=self.worker_loop, name=f"stitch-{i}", daemon=True).start()
+        
+        # Safety-net rescan; new sessions normally arrive through the event bus
         while True:
+            time.sleep(settings.FALLBACK_SCAN_INTERVAL)
             self.scan_for_sessions()
-            
-            if self.queue:
-                sid = self.queue.pop(0)
-                self.run_stitch_job(sid)
-            else:
-                time.sleep(5)
 
 stitcher_service = StitchingService()
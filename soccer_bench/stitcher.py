@@ -4,6 +4,7 @@ import glob
 import logging
 from typing import Dict, List, Optional
 from .config import settings
+from .pipeline.encoders import encoder_probe
 
 logger = logging.getLogger("Stitcher")
 
@@ -81,42 +82,37 @@ class StitcherService:
 
         logger.info(f"Stitching Session: {session_id}")
         
+        # 3x 4K side-by-side is 11520x2160, which is hard to play; we want a 4K-wide panorama.
+        # Each camera is brought down to 1280 wide at decode (on the GPU if there is one),
+        # so the 11520-wide intermediate is never built.
+        decoder_args, input_filter = encoder_probe.decode_options(1280)
+
         # Inputs
         input_args = []
-        input_args.extend(["-i", cam_files["CAM_L"]])
-        input_args.extend(["-i", cam_files["CAM_C"]])
-        input_args.extend(["-i", cam_files["CAM_R"]])
-        
-        # Filter Complex: Horizontal Stack (MVP)
-        # [0:v][1:v][2:v]hstack=inputs=3[v]
-        filter_complex = "[0:v][1:v][2:v]hstack=inputs=3[v]"
+        for role in required:
+            input_args.extend([*decoder_args, "-i", cam_files[role]])
         
-        # Encoding Config (NVENC for speed)
-        # -c:v hevc_nvenc -preset p4 -cq 20
-        # If no GPU, fall back to libx265?
-        # Let's assume NVENC as per README reqs.
+        # Filter Complex: per-input downscale, then Horizontal Stack (MVP)
+        # [0:v]scale[in0];...;[in0][in1][in2]hstack=inputs=3[v]
+        filter_complex = "".join(f"[{i}:v]{input_filter}[in{i}];" for i in range(3))
+        filter_complex += "[in0][in1][in2]hstack=inputs=3"
         
+        # Encoder: fastest working backend on this host (NVENC/QSV/VAAPI/x265/x264), probed once and cached.
+        encoder = encoder_probe.encoder_spec()
+        if encoder.get("filter"):
+            filter_complex += "," + encoder["filter"] # e.g. hwupload for VAAPI
+        filter_complex += "[v]"
+
         cmd = [
             "ffmpeg",
             "-y", # Overwrite
+            *encoder.get("global", []),
             *input_args,
             "-filter_complex", filter_complex,
             "-map", "[v]",
-            "-c:v", "hevc_nvenc", # NVIDIA H.265
-            "-preset", "p4",
-            "-b:v", "15M", # Adjust based on needs. 15M for stitched 12K width? Might need more.
-            # Actually 3x 4K side-by-side is 11520x2160. That's huge.
-            # Maybe scale down?
-            # Let's scale to total width 4K (3840 wide).
-            # 3840 / 3 = 1280 per cam.
-            # filter: hstack=inputs=3,scale=3840:-1
-            # "-filter_complex", "[0:v][1:v][2:v]hstack=inputs=3,scale=3840:-1[v]",
-             outfile
+            *encoder["args"],
+            outfile
         ]
-        
-        # Try full res first? 12K video is hard to play.
-        # Let's do a sensible 4K panoramic output.
-        cmd[7] = "[0:v][1:v][2:v]hstack=inputs=3,scale=3840:-1[v]"
 
         logger.info(f"Running ffmpeg: {' '.join(cmd)}")
         try:
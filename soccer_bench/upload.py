@@ -4,6 +4,7 @@ import time
 import requests
 import shutil
 from .config import settings
+from .jobs import job_store
 
 logger = logging.getLogger("UploadAgent")
 
@@ -11,19 +12,17 @@ upload_service = None # Placeholder to allow class def above without circular is
 
 class UploadService:
     def __init__(self):
-        self.queue = []
         self.status = "idle"
         self.current_file = None
         self.base_url = settings.PLATFORM_URL
         self.creds = (settings.PLATFORM_USER, settings.PLATFORM_PASS)
         self.token = None
-        self.uploaded_files = set()
         
     def get_status(self):
         return {
             "status": self.status,
             "current_op": self.current_file,
-            "queue": len(self.queue)
+            "queue": job_store.count("upload", "pending")
         }
 
     def login(self):
@@ -40,39 +39,30 @@ class UploadService:
             logger.error(f"Login failed: {e}")
             return False
 
-    def scan_for_uploadables(self):
-        # We look for EVENTS (.jsonl) as the signal that processing is done.
-        # We assume the VIDEO (.mp4) is also ready in the parent dir.
-        events_dir = settings.EVENTS_DIR
-        if not os.path.exists(events_dir): return
-        
-        # Files like {session_id}_events.jsonl
-        files = [f for f in os.listdir(events_dir) if f.endswith(".jsonl") and not f.endswith(".uploaded")]
-        
-        for f in files:
-            if f not in self.queue and f not in self.uploaded_files:
-                self.queue.append(f)
-
-    def upload_session(self, event_filename):
-        self.status = "uploading"
-        self.current_file = event_filename
-        
-        # Session ID: "session123_events.jsonl" -> "session123"
-        session_id = event_filename.replace("_events.jsonl", "")
+    def upload_session(self, job):
+        session_id = job["session_id"]
+        artifacts = job["artifacts"]
         
         # Paths
-        event_path = os.path.join(settings.EVENTS_DIR, event_filename)
-        video_filename = f"{session_id}_stitched.mp4"
-        video_path = os.path.join(settings.PROCESSED_STORAGE_DIR, video_filename)
+        event_path = artifacts.get("events")
+        video_path = artifacts.get("stitched")
         
-        if not os.path.exists(video_path):
-            logger.warning(f"Video {video_path} missing for events {event_filename}. Skipping.")
-            self.queue.remove(event_filename) # Maybe wait? But for now remove.
+        if not (video_path and event_path and os.path.exists(video_path) and os.path.exists(event_path)):
+            logger.warning(f"Artifacts missing for {session_id} ({video_path}, {event_path}). Skipping.")
+            job_store.fail(session_id, "upload", "missing artifacts", retry=False)
             return
 
+        video_filename = os.path.basename(video_path)
+        self.status = "uploading"
+        self.current_file = video_filename
+
         if not self.token:
             if not self.login():
-                return # Retry next loop
+                # Platform down / auth broken: not this session's fault, so no attempt is used up
+                job_store.fail(session_id, "upload", "login failed", count=False)
+                self.status = "idle"
+                self.current_file = None
+                return
 
         headers = {"Authorization": f"Bearer {self.token}"}
 
@@ -88,7 +78,8 @@ class UploadService:
             )
             if resp.status_code == 401:
                 self.token = None # Refresh token next time
-                raise Exception("Unauthorized - Token Expired")
+                job_store.fail(session_id, "upload", "Unauthorized - Token Expired", count=False)
+                return
             resp.raise_for_status()
 
             # 2. Upload Video
@@ -102,6 +93,11 @@ class UploadService:
                 )
             resp.raise_for_status()
 
+            # 2b. Upload HLS ladder (optional)
+            hls_master = artifacts.get("hls")
+            if hls_master and os.path.exists(hls_master):
+                self.upload_stream(session_id, os.path.dirname(hls_master), headers)
+
             # 3. Upload Events
             # Platform expects list of events. We need to parse JSONL.
             import json
@@ -122,30 +118,81 @@ class UploadService:
 
             # Success
             logger.info(f"Upload Complete for {session_id}")
-            self.uploaded_files.add(event_filename)
-            self.queue.remove(event_filename)
             
             # Mark uploaded
             os.rename(event_path, event_path + ".uploaded")
+            job_store.complete(session_id, "upload", {"events": event_path + ".uploaded"})
             
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.error(f"Platform unreachable while uploading {session_id}: {e}")
+            job_store.fail(session_id, "upload", e, count=False)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code >= 500:
+                # 502/503/504 from the platform's proxy: an outage, retried with backoff like a dropped connection
+                logger.error(f"Platform error while uploading {session_id}: {e}")
+                job_store.fail(session_id, "upload", e, count=False)
+            else:
+                logger.error(f"Upload failed for {session_id}: {e}")
+                job_store.fail(session_id, "upload", e)
         except Exception as e:
             logger.error(f"Upload failed for {session_id}: {e}")
+            job_store.fail(session_id, "upload", e)
         finally:
             self.status = "idle"
             self.current_file = None
 
+    def upload_stream(self, session_id, hls_dir, headers, batch_size=20):
+        """Uploads each rung's playlist and segments in batches, then master.m3u8 so the platform only links a complete ladder."""
+        rungs = sorted(d for d in os.listdir(hls_dir) if os.path.isdir(os.path.join(hls_dir, d)))
+        batches = []
+        for rung in rungs:
+            rung_dir = os.path.join(hls_dir, rung)
+            # Segments before the playlist that references them
+            names = sorted(os.listdir(rung_dir), key=lambda n: (n.endswith(".m3u8"), n))
+            for i in range(0, len(names), batch_size):
+                batches.append((rung, [os.path.join(rung_dir, n) for n in names[i:i + batch_size]]))
+        batches.append(("", [os.path.join(hls_dir, "master.m3u8")]))
+
+        logger.info(f"Uploading HLS ladder ({', '.join(rungs)}) for {session_id}...")
+        for path, batch in batches:
+            handles = [open(p, 'rb') for p in batch]
+            try:
+                resp = requests.post(
+                    f"{self.base_url}/api/games/{session_id}/stream",
+                    data={"path": path},
+                    files=[("files", (os.path.basename(p), h)) for p, h in zip(batch, handles)],
+                    headers=headers,
+                    timeout=300
+                )
+                resp.raise_for_status()
+            finally:
+                for h in handles:
+                    h.close()
+
     def running_loop(self):
         logger.info("Starting Upload Loop...")
         # Initial Login
         self.login()
         
         while True:
-            self.scan_for_uploadables()
-            
-            if self.queue:
-                f = self.queue[0]
-                self.upload_session(f)
-            else:
-                time.sleep(10)
+            job = None
+            try:
+                seen = job_store.generation("upload")
+                job = job_store.claim("upload")
+                if job:
+                    self.upload_session(job)
+                else:
+                    job_store.wait("upload", seen, timeout=settings.FALLBACK_SCAN_INTERVAL)
+            except Exception as e:
+                # e.g. a locked job store; the thread must outlive it
+                logger.error(f"Upload Loop error: {e}")
+                self.status = "idle"
+                self.current_file = None
+                if job:
+                    try:
+                        job_store.fail(job["session_id"], "upload", e)
+                    except Exception as fail_error:
+                        logger.error(f"Could not record upload failure for {job['session_id']}: {fail_error}")
+                time.sleep(5)
 
 upload_service = UploadService()
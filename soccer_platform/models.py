@@ -28,6 +28,7 @@ class Game(Base):
     status = Column(String, default="processing")
     date = Column(DateTime(timezone=True), nullable=True)
     video_path = Column(String, nullable=True)
+    stream_path = Column(String, nullable=True) # HLS master playlist, if the bench produced a ladder
     teamsnap_data = Column(JSONB, nullable=True) # RAW DATA
     
     # Relationships
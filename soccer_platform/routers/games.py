@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 import aiofiles
 import os
+import re
 import logging
 
 logger = logging.getLogger(__name__)
@@ -181,6 +182,65 @@ async def upload_game_video(
 
     return {"status": "uploaded", "url": f"/videos/{safe_game_id}.mp4"}
 
+# HLS upload: rung directories like "1080p", and playlist/segment files only
+# (MPEG-TS segments, or fMP4 segments plus their init.mp4 for HEVC)
+STREAM_DIR_RE = re.compile(r"^\w*$")
+STREAM_FILE_RE = re.compile(r"^[\w.-]+\.(m3u8|ts|m4s|mp4)$")
+
+@router.post("/games/{game_id}/stream")
+async def upload_game_stream(
+    game_id: str,
+    path: str = Form(""),
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Receives an adaptive-bitrate HLS ladder in batches: each request carries the playlist
+    and segments of one rung (`path`), and master.m3u8 comes last at the root.
+    """
+    if current_user.role not in ["admin", "coach"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    safe_game_id = os.path.basename(game_id)
+    if not safe_game_id or safe_game_id != game_id:
+        raise HTTPException(status_code=400, detail="Invalid game ID format")
+    if not STREAM_DIR_RE.match(path):
+        raise HTTPException(status_code=400, detail="Invalid stream path")
+
+    db_game = await db.get(models.Game, safe_game_id)
+    if not db_game:
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    if current_user.role == "coach":
+        user_team_ids = [t.team_id for t in current_user.teams]
+        if db_game.team_id not in user_team_ids:
+            raise HTTPException(status_code=403, detail="Not authorized for this team's game")
+
+    stream_dir = os.path.join(os.path.dirname(__file__), "..", "..", "videos", f"{safe_game_id}_hls", path)
+    os.makedirs(stream_dir, exist_ok=True)
+
+    saved_master = False
+    for file in files:
+        filename = file.filename or ""
+        if not STREAM_FILE_RE.match(filename):
+            raise HTTPException(status_code=400, detail=f"Invalid stream file: {filename}")
+        try:
+            async with aiofiles.open(os.path.join(stream_dir, filename), 'wb') as out_file:
+                while content := await file.read(1024 * 1024):
+                    await out_file.write(content)
+        except Exception as e:
+            logger.error(f"Stream upload failed for game {safe_game_id}: {e}")
+            raise HTTPException(status_code=500, detail="File upload failed") from e
+        saved_master = saved_master or (not path and filename == "master.m3u8")
+
+    # Only advertise the stream once the master (uploaded last) is in place
+    if saved_master:
+        db_game.stream_path = f"/videos/{safe_game_id}_hls/master.m3u8"
+        await db.commit()
+
+    return {"status": "uploaded", "files": len(files), "url": db_game.stream_path}
+
 @router.get("/games/{game_id}/social")
 async def get_social_clip(
     game_id: str, 
@@ -31,6 +31,7 @@ class GameUpdate(BaseModel):
 
 class GameSchema(GameCreate):
     video_path: Optional[str]
+    stream_path: Optional[str] = None
     events: List[EventCreate] = []
 
     class Config:
@@ -43,6 +44,7 @@ class GameSummary(GameCreate):
     is_home: bool = False
     teamsnap_data: Optional[dict] = None
     video_path: Optional[str]
+    stream_path: Optional[str] = None
     # events excluded for list view performance
 
     class Config:
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 from typing import Optional, List
@@ -8,9 +9,10 @@ import asyncio
 from ..services.recorder import recorder
 from ..services.system import system_monitor
 from ..services.sync import sync_monitor
-from ..services.manifest import manifest_service
+from ..services.manifest import manifest_service, manifest_name
 from ..services.updater import updater_service
 from ..services.mesh import mesh_service
+from ..services.transfer import transfer_service, parse_range, recording_path, RangeNotSatisfiable
 from ..config import settings
 
 router = APIRouter()
@@ -25,6 +27,7 @@ class ConfirmRequest(BaseModel):
     camera_id: str
     file: str
     checksum: dict
+    segment: Optional[int] = None
 
 @router.get("/status")
 async def get_status():
@@ -43,7 +46,8 @@ async def get_status():
         "disk_free_gb": disk["free_gb"],
         "temp_c": system_monitor.get_temperature(),
         "battery_percent": batt["percent"],
-        "sync_offset_ms": sync["offset_ms"]
+        "sync_offset_ms": sync["offset_ms"],
+        "transfer": transfer_service.get_stats()
     }
 
 class StartRecordRequest(BaseModel):
@@ -81,14 +85,84 @@ async def stop_recording(req: StopRecordRequest = StopRecordRequest()): # Defaul
     return result
 
 @router.get("/recordings")
-async def list_recordings():
-    # List files in recording dir
-    files = []
-    if os.path.exists(settings.RECORDINGS_DIR):
-        for f in os.listdir(settings.RECORDINGS_DIR):
-            if f.endswith(".mp4") or f.endswith(".json"):
-                 files.append(f)
-    return {"files": files}
+async def list_recordings(since: str = None):
+    """
+    Lists recordings and manifests with size, mtime, checksum state and offload flag.
+    Pass the returned `cursor` as `since` to get only what changed since the last call.
+    """
+    active_path = recorder.camera.get_active_file() if recorder.is_recording else None
+    active_file = os.path.basename(active_path) if active_path else None
+    listing = manifest_service.list_recordings(since, active_file)
+    
+    # File still being recorded; the bench pulls it incrementally before the manifest exists
+    active = []
+    if active_path and os.path.exists(active_path):
+        active.append({
+            "file": active_file,
+            "size": os.path.getsize(active_path),
+            "session_id": recorder.current_session_id
+        })
+    return {
+        "files": [e["name"] for e in listing["entries"]],
+        "entries": listing["entries"],
+        "cursor": listing["cursor"],
+        "active": active,
+        # Zero-copy download server; None if it isn't running
+        "transfer_port": transfer_service.get_stats()["port"]
+    }
+
+@router.get("/recordings/{filename}")
+async def download_recording(filename: str, request: Request):
+    """
+    Serves a recording or manifest with HTTP Range support.
+    Fallback for clients that can't reach the sendfile transfer server on TRANSFER_PORT;
+    bytes pass through Python here.
+    """
+    file_path = recording_path(filename)
+    if not file_path:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    file_size = os.path.getsize(file_path)
+    try:
+        byte_range = parse_range(request.headers.get("range"), file_size)
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{file_size}"})
+    start, end = byte_range if byte_range else (0, file_size - 1)
+    length = end - start + 1 if file_size else 0
+
+    def iter_file(chunk_size: int = 1024 * 1024):
+        transfer = transfer_service.begin(filename, request.client.host if request.client else None)
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    transfer_service.progress(transfer, len(chunk))
+                    yield chunk
+        finally:
+            transfer_service.end(transfer)
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(length)}
+    status_code = 200
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        status_code = 206
+    media_type = "video/mp4" if filename.endswith(".mp4") else "application/json"
+    return StreamingResponse(iter_file(), status_code=status_code, headers=headers, media_type=media_type)
+
+@router.get("/transfers")
+async def get_transfers():
+    """
+    Active downloads and throughput (Mbps) of the recording transfer server.
+    """
+    return transfer_service.get_stats()
 
 @router.post("/recordings/confirm")
 async def confirm_offload(req: ConfirmRequest):
@@ -101,14 +175,14 @@ async def confirm_offload(req: ConfirmRequest):
     # Usually we trust the client if they send the matching checksum we generated in the manifest.
     
     # Let's check if the manifesto matches the client's claim.
-    manifest_filename = f"{req.session_id}_{req.camera_id}.json"
+    manifest_filename = manifest_name(req.session_id, req.camera_id, req.segment)
     manifest_path = os.path.join(settings.RECORDINGS_DIR, manifest_filename)
     
     if not os.path.exists(manifest_path):
         raise HTTPException(status_code=404, detail="Manifest not found")
         
     # In a real impl, we might re-hash, but for now we mark offloaded if the manifest exists.
-    success = manifest_service.mark_offloaded(req.session_id, req.camera_id)
+    success = manifest_service.mark_offloaded(req.session_id, req.camera_id, req.segment)
     if not success:
          raise HTTPException(status_code=500, detail="Failed to mark offloaded")
          
@@ -160,10 +234,11 @@ class ConfigUpdateRequest(BaseModel):
     height: int
     fps: int
     bitrate: int
+    segment_seconds: Optional[int] = None
 
 @router.post("/config")
 async def update_config(req: ConfigUpdateRequest):
-    success = settings.save(req.model_dump())
+    success = settings.save(req.model_dump(exclude_none=True))
     if not success:
         raise HTTPException(status_code=500, detail="Failed to save settings")
     return {"status": "saved", "config": settings.to_dict()}
@@ -210,6 +285,10 @@ async def switch_uplink(req: UplinkRequest):
 @router.get("/system/mesh")
 async def get_mesh_status():
     """
+    Status of all mesh peers.
+    """
+    return await mesh_service.get_mesh_status()
+
 @router.post("/selftest")
 async def run_selftest():
     return await recorder.run_self_test()
@@ -28,8 +28,11 @@ class Settings:
         self.DEFAULT_HEIGHT: int = 2160
         self.DEFAULT_FPS: int = 30
         self.DEFAULT_BITRATE: int = 40000000 # 40Mbps for high quality
+        self.SEGMENT_SECONDS: int = 0 # 0 = one file per session, else roll over every N seconds
         self.HOST: str = "0.0.0.0"
         self.PORT: int = 8000
+        # Dedicated sendfile server for recording downloads
+        self.TRANSFER_PORT: int = int(os.getenv("TRANSFER_PORT", "8010"))
         
         # Load from file
         self.load()
@@ -44,6 +47,7 @@ class Settings:
                     self.DEFAULT_HEIGHT = data.get("height", self.DEFAULT_HEIGHT)
                     self.DEFAULT_FPS = data.get("fps", self.DEFAULT_FPS)
                     self.DEFAULT_BITRATE = data.get("bitrate", self.DEFAULT_BITRATE)
+                    self.SEGMENT_SECONDS = data.get("segment_seconds", self.SEGMENT_SECONDS)
                     # Host/Port usually env var controlled for startup, but could be here too
             except Exception as e:
                 print(f"Error loading settings: {e}")
@@ -56,6 +60,7 @@ class Settings:
             self.DEFAULT_HEIGHT = int(data.get("height", self.DEFAULT_HEIGHT))
             self.DEFAULT_FPS = int(data.get("fps", self.DEFAULT_FPS))
             self.DEFAULT_BITRATE = int(data.get("bitrate", self.DEFAULT_BITRATE))
+            self.SEGMENT_SECONDS = int(data.get("segment_seconds", self.SEGMENT_SECONDS))
             
             # Write to file
             export_data = {
@@ -63,7 +68,8 @@ class Settings:
                 "width": self.DEFAULT_WIDTH,
                 "height": self.DEFAULT_HEIGHT,
                 "fps": self.DEFAULT_FPS,
-                "bitrate": self.DEFAULT_BITRATE
+                "bitrate": self.DEFAULT_BITRATE,
+                "segment_seconds": self.SEGMENT_SECONDS
             }
             with open(self.SETTINGS_FILE, "w") as f:
                 json.dump(export_data, f, indent=2)
@@ -78,7 +84,8 @@ class Settings:
             "width": self.DEFAULT_WIDTH,
             "height": self.DEFAULT_HEIGHT,
             "fps": self.DEFAULT_FPS,
-            "bitrate": self.DEFAULT_BITRATE
+            "bitrate": self.DEFAULT_BITRATE,
+            "segment_seconds": self.SEGMENT_SECONDS
          }
 
 settings = Settings()
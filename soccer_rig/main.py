@@ -5,6 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from .config import settings
+from .services.transfer import transfer_service
 
 # Setup Logging
 logging.basicConfig(
@@ -20,12 +21,14 @@ async def lifespan(app: FastAPI):
     logger.info(f"Node ID: {settings.NODE_ID}, Is Pi: {settings.IS_PI}")
     
     # Initialize services here (Camera, Sync, etc.)
+    transfer_service.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
     # Cleanup services
+    transfer_service.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
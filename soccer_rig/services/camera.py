@@ -2,16 +2,27 @@ import asyncio
 import subprocess
 import logging
 import os
-from typing import Optional
+import hashlib
+import threading
+import time
+from typing import Optional, Callable
 from abc import ABC, abstractmethod
 
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
+# Called as on_segment(index, path, checksum, started_at, duration, final) whenever a segment closes
+SegmentCallback = Callable[[int, str, Optional[str], float, float, bool], None]
+
+def segment_path(file_path: str, index: int) -> str:
+    base, ext = os.path.splitext(file_path)
+    return f"{base}_seg{index:04d}{ext}"
+
 class BaseCameraService(ABC):
     @abstractmethod
-    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None):
+    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None,
+                              segment_seconds: int = 0, on_segment: Optional[SegmentCallback] = None):
         pass
 
     @abstractmethod
@@ -27,18 +38,124 @@ class BaseCameraService(ABC):
         """Returns True if recording must be stopped to take a snapshot (resource conflict)"""
         pass
 
+    def get_checksum(self) -> Optional[str]:
+        """SHA-256 of the last finished recording, if it was hashed while writing."""
+        return None
+
+    def get_active_file(self) -> Optional[str]:
+        """Path of the file currently being written (the open segment in segmented mode)."""
+        return None
+
+class HashingWriter:
+    """
+    Pumps the encoder's stdout into the recording file and a SHA-256 in one pass,
+    so the digest is ready the moment the stream closes.
+    """
+    def __init__(self, source, file_path: str, chunk_size: int = 1024 * 1024):
+        self.source = source
+        self.file_path = file_path
+        self.current_path = file_path
+        self.chunk_size = chunk_size
+        self.hasher = hashlib.sha256()
+        self.bytes_written = 0
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self._pump, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _pump(self):
+        try:
+            with open(self.file_path, "wb") as f:
+                for chunk in iter(lambda: self.source.read(self.chunk_size), b""):
+                    f.write(chunk)
+                    self.hasher.update(chunk)
+                    self.bytes_written += len(chunk)
+        except Exception as e:
+            logger.error(f"Recording writer failed: {e}")
+            self.error = e
+
+    def finish(self) -> Optional[str]:
+        """
+        Waits for the stream to drain and returns the hex digest (None on error).
+        Called once the encoder has exited, so the pipe is at EOF and this can't hang;
+        no timeout, since the file mustn't be re-hashed while the pump is still writing it.
+        """
+        self.thread.join()
+        if self.error:
+            return None
+        return self.hasher.hexdigest()
+
+class SegmentingWriter(HashingWriter):
+    """
+    HashingWriter that rolls over to a new file every `segment_seconds`.
+    Splits happen just before an H.265 VPS NAL (emitted ahead of each IDR with
+    --inline), so every segment is independently decodable and hashed in the same pass.
+    """
+    VPS_START_CODE = b"\x00\x00\x01\x40\x01"
+
+    def __init__(self, source, file_path: str, segment_seconds: int, on_segment: SegmentCallback,
+                 chunk_size: int = 1024 * 1024):
+        super().__init__(source, file_path, chunk_size)
+        self.segment_seconds = segment_seconds
+        self.on_segment = on_segment
+        self.index = 0
+
+    def _close_segment(self, f, started_at: float, final: bool):
+        f.close()
+        path = segment_path(self.file_path, self.index)
+        try:
+            self.on_segment(self.index, path, self.hasher.hexdigest(), started_at, time.time() - started_at, final)
+        except Exception as e:
+            logger.error(f"Segment callback failed for {path}: {e}")
+
+    def _pump(self):
+        try:
+            self.current_path = segment_path(self.file_path, self.index)
+            f = open(self.current_path, "wb")
+            started_at = time.time()
+            segment_bytes = 0
+            for chunk in iter(lambda: self.source.read(self.chunk_size), b""):
+                cut = -1
+                if segment_bytes and time.time() - started_at >= self.segment_seconds:
+                    cut = chunk.find(self.VPS_START_CODE)
+                if cut >= 0:
+                    head, chunk = chunk[:cut], chunk[cut:]
+                    f.write(head)
+                    self.hasher.update(head)
+                    self.bytes_written += len(head)
+                    self._close_segment(f, started_at, final=False)
+                    self.index += 1
+                    self.hasher = hashlib.sha256()
+                    self.current_path = segment_path(self.file_path, self.index)
+                    f = open(self.current_path, "wb")
+                    started_at = time.time()
+                    segment_bytes = 0
+                f.write(chunk)
+                self.hasher.update(chunk)
+                self.bytes_written += len(chunk)
+                segment_bytes += len(chunk)
+            self._close_segment(f, started_at, final=True)
+        except Exception as e:
+            logger.error(f"Segmented recording writer failed: {e}")
+            self.error = e
+
 class RealCameraService(BaseCameraService):
     def __init__(self):
         self.process: Optional[subprocess.Popen] = None
+        self.writer: Optional[HashingWriter] = None
+        self.last_checksum: Optional[str] = None
         
-    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None):
+    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None,
+                              segment_seconds: int = 0, on_segment: Optional[SegmentCallback] = None):
         if self.process and self.process.poll() is None:
             logger.warning("Recording already in progress")
             return
 
+        # Encoder writes to stdout; HashingWriter tees it to disk and the hash
         cmd = [
             "rpicam-vid",
-            "-o", file_path,
+            "-o", "-",
             "--width", str(width or settings.DEFAULT_WIDTH),
             "--height", str(height or settings.DEFAULT_HEIGHT),
             "--framerate", str(fps or settings.DEFAULT_FPS),
@@ -47,9 +164,18 @@ class RealCameraService(BaseCameraService):
             "--nopreview",
             "--timeout", str(duration * 1000) # 0 = infinite
         ]
+        if segment_seconds:
+            # Headers before every IDR + 1s GOP so segments can be cut close to the target length
+            cmd += ["--inline", "--intra", str(fps or settings.DEFAULT_FPS)]
         
         logger.info(f"Starting recording: {' '.join(cmd)}")
-        self.process = subprocess.Popen(cmd)
+        self.last_checksum = None
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+        if segment_seconds:
+            self.writer = SegmentingWriter(self.process.stdout, file_path, segment_seconds, on_segment)
+        else:
+            self.writer = HashingWriter(self.process.stdout, file_path)
+        self.writer.start()
 
     async def stop_recording(self):
         if self.process:
@@ -60,6 +186,15 @@ class RealCameraService(BaseCameraService):
             except subprocess.TimeoutExpired:
                 self.process.kill()
             self.process = None
+        if self.writer:
+            self.last_checksum = await asyncio.to_thread(self.writer.finish)
+            self.writer = None
+
+    def get_checksum(self) -> Optional[str]:
+        return self.last_checksum
+
+    def get_active_file(self) -> Optional[str]:
+        return self.writer.current_path if self.writer else None
 
     async def capture_snapshot(self, output_path: str):
         # rpicam-jpeg conflicts with rpicam-vid if not careful. 
@@ -96,24 +231,57 @@ class MockCameraService(BaseCameraService):
     def __init__(self):
         self._recording_task: Optional[asyncio.Task] = None
         self._is_recording = False
+        self._hasher = None
+        self._active_file = None
         
-    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None):
+    async def start_recording(self, file_path: str, duration: int = 0, width: int = None, height: int = None, fps: int = None, bitrate: int = None,
+                              segment_seconds: int = 0, on_segment: Optional[SegmentCallback] = None):
         if self._is_recording:
             logger.warning("Mock recording already in progress")
             return
             
         logger.info(f"Starting MOCK recording to {file_path}")
         self._is_recording = True
-        self._recording_task = asyncio.create_task(self._simulate_file_growth(file_path))
+        self._hasher = hashlib.sha256()
+        if segment_seconds:
+            self._recording_task = asyncio.create_task(self._simulate_segments(file_path, segment_seconds, on_segment))
+        else:
+            self._recording_task = asyncio.create_task(self._simulate_file_growth(file_path))
 
     async def _simulate_file_growth(self, file_path):
+        self._active_file = file_path
         try:
             with open(file_path, "wb") as f:
                 while self._is_recording:
-                    f.write(b"\x00" * 1024 * 1024) # 1MB per tick
+                    chunk = b"\x00" * 1024 * 1024 # 1MB per tick
+                    f.write(chunk)
+                    self._hasher.update(chunk)
                     await asyncio.sleep(1)
         except Exception as e:
             logger.error(f"Mock recording failed: {e}")
+            self._hasher = None
+
+    async def _simulate_segments(self, file_path, segment_seconds, on_segment):
+        index = 0
+        try:
+            while True:
+                path = segment_path(file_path, index)
+                self._active_file = path
+                hasher = hashlib.sha256()
+                started_at = time.time()
+                with open(path, "wb") as f:
+                    while self._is_recording and time.time() - started_at < segment_seconds:
+                        chunk = b"\x00" * 1024 * 1024 # 1MB per tick
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        await asyncio.sleep(1)
+                final = not self._is_recording
+                on_segment(index, path, hasher.hexdigest(), started_at, time.time() - started_at, final)
+                if final:
+                    break
+                index += 1
+        except Exception as e:
+            logger.error(f"Mock segmented recording failed: {e}")
 
     async def stop_recording(self):
         logger.info("Stopping MOCK recording")
@@ -121,6 +289,13 @@ class MockCameraService(BaseCameraService):
         if self._recording_task:
             await self._recording_task
             self._recording_task = None
+        self._active_file = None
+
+    def get_checksum(self) -> Optional[str]:
+        return self._hasher.hexdigest() if self._hasher else None
+
+    def get_active_file(self) -> Optional[str]:
+        return self._active_file if self._is_recording else None
 
     async def capture_snapshot(self, output_path: str):
         logger.info(f"Taking MOCK snapshot to {output_path}")
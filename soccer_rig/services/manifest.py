@@ -2,8 +2,10 @@ import json
 import os
 import hashlib
 import logging
+import threading
 import time
-from typing import Dict, Any, List
+import uuid
+from typing import Dict, Any, List, Optional
 
 from ..config import settings
 from .system import system_monitor
@@ -11,7 +13,121 @@ from .sync import sync_monitor
 
 logger = logging.getLogger(__name__)
 
+def manifest_name(session_id: str, camera_id: str, segment: int = None) -> str:
+    if segment is None:
+        return f"{session_id}_{camera_id}.json"
+    return f"{session_id}_{camera_id}_seg{segment:04d}.json"
+
 class ManifestService:
+    def __init__(self):
+        # Parsed manifests keyed by path -> (mtime_ns, data); avoids re-parsing on every listing
+        self._cache: Dict[str, Any] = {}
+        # Listing cursor: a change counter rather than mtimes, which can tie within a
+        # tick or jump back with the clock. Each file keeps the sequence number of its
+        # last seen (mtime_ns, size); the epoch invalidates cursors from a previous run.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._stamps: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def read_manifest(self, path: str, mtime_ns: int) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except Exception:
+            return None
+        self._cache[path] = (mtime_ns, data)
+        return data
+
+    def write_manifest(self, path: str, data: Dict[str, Any]):
+        # Readers (listing, bench download) never see a half-written manifest
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def list_recordings(self, since: str = None, active_file: str = None) -> Dict[str, Any]:
+        """
+        Rich listing of recordings and manifests.
+        The cursor is opaque; passing it back as `since` returns only entries created
+        or modified after it was issued. An unknown or stale cursor returns everything.
+        Deletions are not reported.
+        """
+        with self._lock:
+            return self._list_recordings(since, active_file)
+
+    def _list_recordings(self, since: Optional[str], active_file: Optional[str]) -> Dict[str, Any]:
+        epoch, _, seq = (since or "").partition(":")
+        since_seq = int(seq) if epoch == self._epoch and seq.isdigit() else 0
+        entries = []
+        if not os.path.exists(settings.RECORDINGS_DIR):
+            return {"entries": entries, "cursor": f"{self._epoch}:{self._seq}"}
+
+        scanned = []
+        for f in os.listdir(settings.RECORDINGS_DIR):
+            if not (f.endswith(".mp4") or f.endswith(".json")):
+                continue
+            try:
+                st = os.stat(os.path.join(settings.RECORDINGS_DIR, f))
+            except FileNotFoundError:
+                continue
+            scanned.append((f, st))
+        scanned.sort(key=lambda item: item[1].st_mtime_ns)
+
+        # Checksum / offload state of each video comes from the manifest that references it
+        video_state = {}
+        manifests = {}
+        for f, st in scanned:
+            if f.endswith(".json"):
+                data = self.read_manifest(os.path.join(settings.RECORDINGS_DIR, f), st.st_mtime_ns)
+                if data:
+                    manifests[f] = data
+                    value = data.get("checksum", {}).get("value")
+                    video_state[data.get("file")] = {
+                        "checksum": "ready" if value and value != "error" else "error",
+                        "offloaded": bool(data.get("offloaded"))
+                    }
+
+        for f, st in scanned:
+            if f.endswith(".json") and f not in manifests:
+                continue # Unreadable / non-manifest json; stamped once it parses
+            key = (st.st_mtime_ns, st.st_size)
+            stamp = self._stamps.get(f)
+            if not stamp or stamp[0] != key:
+                self._seq += 1
+                stamp = self._stamps[f] = (key, self._seq)
+            if stamp[1] <= since_seq:
+                continue
+            entry = {"name": f, "size": st.st_size, "mtime": st.st_mtime}
+            if f in manifests:
+                data = manifests[f]
+                entry.update({
+                    "type": "manifest",
+                    "file": data.get("file"),
+                    "session_id": data.get("session_id"),
+                    "camera_id": data.get("camera_id"),
+                    "segment": data.get("segment"),
+                    "checksum": video_state[data.get("file")]["checksum"],
+                    "offloaded": bool(data.get("offloaded"))
+                })
+            else:
+                state = video_state.get(f)
+                if f == active_file:
+                    state = {"checksum": "pending", "offloaded": False}
+                entry.update({"type": "video", "recording": f == active_file, **(state or {"checksum": "none", "offloaded": False})})
+            entries.append(entry)
+
+        # Forget deleted / offloaded-and-removed files, or a rig running for weeks grows without bound
+        present = {f for f, _ in scanned}
+        for f in [f for f in self._stamps if f not in present]:
+            del self._stamps[f]
+        for path in [p for p in self._cache if os.path.basename(p) not in present]:
+            del self._cache[path]
+        return {"entries": entries, "cursor": f"{self._epoch}:{self._seq}"}
+
     def calculate_checksum(self, file_path: str) -> str:
         sha256_hash = hashlib.sha256()
         try:
@@ -28,10 +144,16 @@ class ManifestService:
                         file_path: str, 
                         start_time_local: float, 
                         duration: float, 
-                        dropped_frames: int = 0) -> str:
-        
+                        dropped_frames: int = 0,
+                        checksum: str = None,
+                        segment: int = None,
+                        final: bool = True) -> str:
+        """
+        Writes the manifest for a recording. In segmented mode each closed segment
+        gets its own manifest, tagged with its index and whether it is the last one.
+        """
         filename = os.path.basename(file_path)
-        manifest_filename = f"{session_id}_{settings.NODE_ID}.json"
+        manifest_filename = manifest_name(session_id, settings.NODE_ID, segment)
         manifest_path = os.path.join(settings.RECORDINGS_DIR, manifest_filename)
         
         sync_status = sync_monitor.get_sync_status()
@@ -50,27 +172,30 @@ class ManifestService:
             "dropped_frames": dropped_frames,
             "checksum": {
                 "algo": "sha256",
-                "value": self.calculate_checksum(file_path)
+                # Normally hashed while recording; full re-read only as a fallback
+                "value": checksum or self.calculate_checksum(file_path)
             },
             "offloaded": False,
             "software_version": settings.VERSION,
             "created_at": time.time()
         }
+        if segment is not None:
+            data["segment"] = segment
+            data["final"] = final
         
         try:
-            with open(manifest_path, "w") as f:
-                json.dump(data, f, indent=2)
+            self.write_manifest(manifest_path, data)
             logger.info(f"Manifest created: {manifest_path}")
             return manifest_filename
         except Exception as e:
             logger.error(f"Failed to write manifest: {e}")
             return None
 
-    def mark_offloaded(self, session_id: str, camera_id: str) -> bool:
+    def mark_offloaded(self, session_id: str, camera_id: str, segment: int = None) -> bool:
         """
-        Marks a session as offloaded in its manifest.
+        Marks a session (or one segment of it) as offloaded in its manifest.
         """
-        manifest_filename = f"{session_id}_{camera_id}.json"
+        manifest_filename = manifest_name(session_id, camera_id, segment)
         manifest_path = os.path.join(settings.RECORDINGS_DIR, manifest_filename)
         
         if not os.path.exists(manifest_path):
@@ -82,8 +207,7 @@ class ManifestService:
             
             data["offloaded"] = True
             
-            with open(manifest_path, "w") as f:
-                json.dump(data, f, indent=2)
+            self.write_manifest(manifest_path, data)
             
             return True
         except Exception as e:
@@ -20,7 +20,24 @@ class RecorderService:
         self.current_session_id = None
         self.current_file_path = None
         self.start_time = None
+        self.segment_seconds = 0
+        self.segment_manifests = []
         
+    def on_segment_closed(self, session_id: str, index: int, path: str, checksum: str,
+                          started_at: float, duration: float, final: bool):
+        """Writes a manifest for each closed segment so the bench can pull it mid-game."""
+        manifest_file = manifest_service.create_manifest(
+            session_id=session_id,
+            file_path=path,
+            start_time_local=started_at,
+            duration=duration,
+            checksum=checksum,
+            segment=index,
+            final=final
+        )
+        if manifest_file:
+            self.segment_manifests.append(manifest_file)
+
     async def start_session(self, session_id: str):
         if self.is_recording:
             raise RuntimeError("Recording already in progress")
@@ -44,7 +61,12 @@ class RecorderService:
         
         logger.info(f"Starting session {session_id} -> {file_path}")
         
-        await self.camera.start_recording(file_path)
+        self.segment_manifests = []
+        self.segment_seconds = settings.SEGMENT_SECONDS
+        on_segment = None
+        if self.segment_seconds:
+            on_segment = lambda *args: self.on_segment_closed(session_id, *args)
+        await self.camera.start_recording(file_path, segment_seconds=self.segment_seconds, on_segment=on_segment)
         
         self.is_recording = True
         self.current_session_id = session_id
@@ -89,13 +111,17 @@ class RecorderService:
         
         duration = time.time() - self.start_time if self.start_time else 0
         
-        if duration > 0:
+        if self.segment_seconds:
+            # Segmented mode: the final segment's manifest was written when the stream closed
+            manifest_file = None
+        elif duration > 0:
             manifest_file = await asyncio.to_thread(
                 manifest_service.create_manifest,
                 session_id=self.current_session_id,
                 file_path=self.current_file_path,
                 start_time_local=self.start_time,
-                duration=duration
+                duration=duration,
+                checksum=self.camera.get_checksum()
             )
         else:
             manifest_file = None
@@ -104,6 +130,7 @@ class RecorderService:
             "session_id": self.current_session_id,
             "file": self.current_file_path,
             "manifest": manifest_file,
+            "segments": list(self.segment_manifests),
             "duration": duration,
             "status": "stopped"
         }
@@ -0,0 +1,181 @@
+import os
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from typing import Optional, Tuple, Dict, Any
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single 'bytes=start-end' Range header.
+    Returns (start, end) inclusive, or None for a full-file response.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].split(",")[0].strip()
+    start_s, _, end_s = spec.partition("-")
+    try:
+        if start_s == "":
+            # Suffix range: last N bytes
+            length = int(end_s)
+            start, end = max(0, file_size - length), file_size - 1
+        else:
+            start = int(start_s)
+            end = int(end_s) if end_s else file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, file_size - 1)
+
+def recording_path(filename: str) -> Optional[str]:
+    """Resolves a recording/manifest name inside RECORDINGS_DIR, rejecting anything else."""
+    if filename != os.path.basename(filename) or not (filename.endswith(".mp4") or filename.endswith(".json")):
+        return None
+    return os.path.join(settings.RECORDINGS_DIR, filename)
+
+class RecordingRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET/HEAD /recordings/{file} with Range support.
+    The body goes out with socket.sendfile (os.sendfile), so bytes never pass through Python.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+
+    def do_GET(self):
+        self.serve(send_body=True)
+
+    def do_HEAD(self):
+        self.serve(send_body=False)
+
+    def serve(self, send_body: bool):
+        prefix = "/recordings/"
+        path = self.path.split("?")[0]
+        file_path = recording_path(unquote(path[len(prefix):])) if path.startswith(prefix) else None
+        if not file_path or not os.path.isfile(file_path):
+            self.send_error(404, "Recording not found")
+            return
+
+        file_size = os.path.getsize(file_path)
+        try:
+            byte_range = parse_range(self.headers.get("Range"), file_size)
+        except RangeNotSatisfiable:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{file_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byte_range if byte_range else (0, file_size - 1)
+        length = end - start + 1 if file_size else 0
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Content-Type", "video/mp4" if file_path.endswith(".mp4") else "application/json")
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+        self.end_headers()
+        if not send_body or not length:
+            return
+
+        transfer = transfer_service.begin(os.path.basename(file_path), self.client_address[0])
+        try:
+            with open(file_path, "rb") as f:
+                offset, remaining = start, length
+                while remaining > 0:
+                    sent = self.connection.sendfile(f, offset, min(transfer_service.CHUNK_SIZE, remaining))
+                    if not sent:
+                        break
+                    offset += sent
+                    remaining -= sent
+                    transfer_service.progress(transfer, sent)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"Client {self.client_address[0]} dropped transfer of {transfer['file']}")
+        finally:
+            transfer_service.end(transfer)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class TransferService:
+    """
+    Serves recordings to the bench on TRANSFER_PORT and keeps throughput stats
+    for both this server and the API fallback route.
+    """
+    CHUNK_SIZE = 8 * 1024 * 1024
+
+    def __init__(self):
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.lock = threading.Lock()
+        self.active: Dict[int, Dict[str, Any]] = {}
+        self.bytes_sent = 0
+        self.last_throughput_mbps = 0.0
+        self._next_id = 0
+
+    def start(self):
+        if self.server:
+            return
+        try:
+            self.server = ThreadingHTTPServer((settings.HOST, settings.TRANSFER_PORT), RecordingRequestHandler)
+        except OSError as e:
+            logger.error(f"Transfer server failed to bind port {settings.TRANSFER_PORT}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Transfer server listening on {settings.TRANSFER_PORT}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def begin(self, file: str, client: str) -> Dict[str, Any]:
+        with self.lock:
+            self._next_id += 1
+            transfer = {"id": self._next_id, "file": file, "client": client, "bytes": 0, "started": time.time()}
+            self.active[transfer["id"]] = transfer
+        return transfer
+
+    def progress(self, transfer: Dict[str, Any], sent: int):
+        with self.lock:
+            transfer["bytes"] += sent
+            self.bytes_sent += sent
+
+    def end(self, transfer: Dict[str, Any]):
+        elapsed = time.time() - transfer["started"]
+        with self.lock:
+            self.active.pop(transfer["id"], None)
+            if elapsed > 0:
+                self.last_throughput_mbps = round(transfer["bytes"] * 8 / elapsed / 1e6, 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self.lock:
+            transfers = [
+                {
+                    "file": t["file"],
+                    "client": t["client"],
+                    "bytes": t["bytes"],
+                    "mbps": round(t["bytes"] * 8 / max(now - t["started"], 1e-3) / 1e6, 1)
+                }
+                for t in self.active.values()
+            ]
+            return {
+                "port": settings.TRANSFER_PORT if self.server else None,
+                "active": len(transfers),
+                "throughput_mbps": round(sum(t["mbps"] for t in transfers), 1),
+                "last_throughput_mbps": self.last_throughput_mbps,
+                "bytes_sent": self.bytes_sent,
+                "transfers": transfers
+            }
+
+transfer_service = TransferService()